@@ -1,12 +1,81 @@
 # src/config.py - Configuration loading and management
 
 import os
+import json
+import hashlib
 import yaml # Requires PyYAML package
 
+# Prefer the LibYAML-backed loader when PyYAML was built with it (much faster),
+# falling back to the pure-Python SafeLoader otherwise.
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
 # Get default config path from environment variable set by action.yml, 
 # defaulting to the standard path if not set (e.g., during local testing)
 DEFAULT_CONFIG_PATH_IN_REPO = os.getenv("CONFIG_PATH", ".github/gemini-reviewer.yml") 
 DEFAULT_INSTRUCTIONS = "Focus on bugs, security, and performance. Do not suggest code comments."
+# Expected shape of the user config, built once at import:
+# key -> (allowed type(s), required item type for lists or None, default)
+_CONFIG_SCHEMA = {
+    "exclude": (list, str, []),
+    "custom_instructions": (str, None, DEFAULT_INSTRUCTIONS),
+    "jira": ((dict, type(None)), None, None), # Placeholder for Jira config
+}
+
+def _validate_config(user_config):
+    """Builds the config from the parsed YAML, replacing missing or mistyped keys with defaults."""
+    config = {}
+    for key, (allowed_types, item_type, default) in _CONFIG_SCHEMA.items():
+        value = user_config.get(key, default)
+        if not isinstance(value, allowed_types) or (item_type and not all(isinstance(item, item_type) for item in value)):
+            print(f"Warning: '{key}' key in config has an invalid value ({type(value).__name__}). Using default.")
+            value = default
+        config[key] = list(value) if isinstance(value, list) else value
+    # Ensure instructions are treated as a single string block
+    config["custom_instructions"] = config["custom_instructions"].strip()
+    return config
+
+# Directory for parsed-config sidecars, one per config path; kept out of the checked-out workspace
+CONFIG_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "gemini-review")
+
+# In-process memo of loaded configs: {(absolute_config_path, mtime): config}
+# Callers treat the returned config as read-only, so it is shared, not copied.
+_CONFIG_CACHE = {}
+
+def _config_cache_path(absolute_config_path):
+    """Sidecar path for a config file, keyed by a hash of its absolute path."""
+    digest = hashlib.sha1(os.path.abspath(absolute_config_path).encode("utf-8")).hexdigest()
+    return os.path.join(CONFIG_CACHE_DIR, f"config-{digest}.json")
+
+def _read_config_cache(cache_path, config_mtime):
+    """Returns the cached config if the sidecar is at least as new as the YAML, else None.
+    The cached value is re-validated, so a corrupted or hand-edited sidecar can't yield a bad config.
+    """
+    try:
+        if os.path.getmtime(cache_path) < config_mtime:
+            return None # Stale cache, YAML was modified after it was written
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None # Missing or unreadable cache, parse the YAML instead
+    return _validate_config(cached) if isinstance(cached, dict) else None
+
+def _write_config_cache(cache_path, config):
+    """Atomically writes the validated config to the JSON sidecar. Failures are non-fatal."""
+    tmp_path = cache_path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError) as e: # Unwritable cache dir or non-JSON-serializable values
+        print(f"Warning: Could not write config cache {cache_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
 
 def load_config(config_path_override=None):
     """Loads configuration from the YAML file or returns defaults.
@@ -14,11 +83,7 @@ def load_config(config_path_override=None):
     """
     target_config_path = config_path_override if config_path_override else DEFAULT_CONFIG_PATH_IN_REPO
     
-    config = {
-        "exclude": [],
-        "custom_instructions": DEFAULT_INSTRUCTIONS,
-        "jira": None # Placeholder for Jira config
-    }
+    config = _validate_config({})
 
     # Important: When running as an action, the config file path is relative
     # to the root of the *consuming* repository, not the action repository.
@@ -28,19 +93,33 @@ def load_config(config_path_override=None):
 
     print(f"Attempting to load config from: {absolute_config_path} (relative: {target_config_path})")
 
+    cache_path = _config_cache_path(absolute_config_path)
+    parsed_from_file = False
+
     if os.path.exists(absolute_config_path):
+        config_mtime = os.path.getmtime(absolute_config_path)
+        memo_key = (os.path.abspath(absolute_config_path), config_mtime)
+        if memo_key in _CONFIG_CACHE:
+            return _CONFIG_CACHE[memo_key]
+
+        cached_config = _read_config_cache(cache_path, config_mtime)
+        if cached_config is not None:
+            print(f"Loaded configuration from cache {cache_path}")
+            _CONFIG_CACHE[memo_key] = cached_config
+            return cached_config
+
         try:
             with open(absolute_config_path, 'r') as f:
-                user_config = yaml.safe_load(f)
+                user_config = yaml.load(f, Loader=_Loader)
             
-            if user_config:
-                config["exclude"] = user_config.get("exclude", [])
-                # Ensure instructions are treated as a single string block
-                config["custom_instructions"] = user_config.get("custom_instructions", DEFAULT_INSTRUCTIONS).strip()
-                config["jira"] = user_config.get("jira") # Load entire Jira block if present
+            if isinstance(user_config, dict) and user_config:
+                config = _validate_config(user_config)
                 print(f"Loaded configuration from {absolute_config_path}")
+            elif user_config:
+                print(f"Warning: Configuration file {absolute_config_path} is not a mapping, using defaults.")
             else:
                  print(f"Configuration file {absolute_config_path} is empty, using defaults.")
+            parsed_from_file = True
 
         except yaml.YAMLError as e:
             print(f"Error parsing YAML configuration file {absolute_config_path}: {e}")
@@ -51,13 +130,10 @@ def load_config(config_path_override=None):
     else:
         print(f"Configuration file {absolute_config_path} not found, using defaults.")
 
-    # Basic validation
-    if not isinstance(config["exclude"], list):
-        print(f"Warning: 'exclude' key in config is not a list. Ignoring.")
-        config["exclude"] = []
-    if not isinstance(config["custom_instructions"], str):
-         print(f"Warning: 'custom_instructions' key in config is not a string. Using default.")
-         config["custom_instructions"] = DEFAULT_INSTRUCTIONS
+    # Only cache successful parses so a broken YAML is re-reported on the next run
+    if parsed_from_file:
+        _write_config_cache(cache_path, config)
+        _CONFIG_CACHE[memo_key] = config
 
     return config
 
@@ -90,5 +166,8 @@ jira:
     print("\nDefault Config:")
     print(json.dumps(default_cfg, indent=2))
 
-    # Clean up dummy file
-    os.remove(dummy_path) 
\ No newline at end of file
+    # Clean up dummy file (and its parsed-config cache)
+    os.remove(dummy_path)
+    dummy_cache_path = _config_cache_path(os.path.join(os.getenv("GITHUB_WORKSPACE", "."), dummy_path))
+    if os.path.exists(dummy_cache_path):
+        os.remove(dummy_cache_path) 
\ No newline at end of file
@@ -2,57 +2,106 @@
 
 import os
 import json
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+import hashlib
+import asyncio
 import sys
+import logging
+# google.generativeai is imported lazily in GeminiClient (it pulls in grpc/protobuf/google-auth),
+# so runs that exit before reaching the summarization/review phases don't pay for it.
+
+log = logging.getLogger(__name__)
+
+# Prefer orjson for parsing review payloads; fall back to the stdlib if unavailable
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+def _strip_json_fences(text):
+    """Strips surrounding whitespace and ```json ... ``` fences Gemini sometimes adds.
+    Finds the payload bounds by index and slices once instead of building
+    an intermediate string per strip/removeprefix/removesuffix step.
+    """
+    i, j = 0, len(text)
+    while i < j and text[i].isspace():
+        i += 1
+    while j > i and text[j - 1].isspace():
+        j -= 1
+    if text.startswith("```json", i, j):
+        i += 7
+    elif text.startswith("```", i, j):
+        i += 3
+    if j - i >= 3 and text.endswith("```", i, j):
+        j -= 3
+    return text[i:j].strip()
 
 # Get model name from environment variable, falling back to a default
 DEFAULT_MODEL_NAME = "gemini-1.5-flash-latest"
 ENV_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", DEFAULT_MODEL_NAME)
 
+# API key genai was last configured with; genai.configure is global, so only redo it if the key changes
+_configured_api_key = None
+
 class GeminiClient:
+    # Populated by _load_sdk() on first instantiation and shared by later instances
+    _genai = None
+    _default_safety_settings = None
+
+    @classmethod
+    def _load_sdk(cls):
+        """Imports google.generativeai on first use and builds the default safety settings once."""
+        if cls._genai is None:
+            import google.generativeai as genai
+            from google.generativeai.types import HarmCategory, HarmBlockThreshold
+            # Safety settings (consider making these configurable too)
+            cls._default_safety_settings = {
+                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            }
+            cls._genai = genai
+        return cls._genai
+
     def __init__(self):
         # Read API Key from environment variable (set by action.yml)
         self.api_key = os.getenv("GEMINI_API_KEY")
         self.model_name = ENV_MODEL_NAME # Use the model name determined at module load time
+        self._token_counts = {} # sha1 digest of text -> token count, see count_tokens()
         
         if not self.api_key:
             # Exit if API key is missing - this is mandatory
-            print("Error: GEMINI_API_KEY environment variable not set.", file=sys.stderr)
+            log.error("GEMINI_API_KEY environment variable not set.")
             sys.exit("Missing GEMINI_API_KEY environment variable.") # Use sys.exit with message
             # Or raise ValueError("GEMINI_API_KEY environment variable not set.") if main.py handles it
 
         try:
-            genai.configure(api_key=self.api_key)
-            # Safety settings (consider making these configurable too)
-            self.safety_settings = {
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-            }
+            genai = self._load_sdk()
+            global _configured_api_key
+            if _configured_api_key != self.api_key:
+                genai.configure(api_key=self.api_key)
+                _configured_api_key = self.api_key
+            self.safety_settings = self._default_safety_settings
             self.model = genai.GenerativeModel(
                 model_name=self.model_name,
                 safety_settings=self.safety_settings
             )
-            print(f"GeminiClient initialized with model: {self.model_name}")
+            log.info("GeminiClient initialized with model: %s", self.model_name)
         except Exception as e:
-            print(f"Error configuring Gemini client: {e}", file=sys.stderr)
+            log.error("Error configuring Gemini client: %s", e)
             # Exit if model initialization fails
             sys.exit(f"Failed to initialize Gemini model '{self.model_name}': {e}")
 
     def generate_text(self, prompt):
         """Sends a prompt to Gemini and returns the raw text response."""
         if not self.model:
-            print("Error: Gemini model not initialized.", file=sys.stderr)
+            log.error("Gemini model not initialized.")
             return None # Return None to indicate failure
 
         response_text = None
         try:
-            print(f"\n--- Sending Text Prompt to Gemini ({self.model_name}) ---")
-            # print(prompt) # Keep prompt logging minimal unless debugging
-            print("Prompt length:", len(prompt), "chars")
-            print("-------------------------------------------------")
+            log.debug("Sending text prompt to Gemini (%s), prompt length: %d chars", self.model_name, len(prompt))
 
             # Make the API call
             response = self.model.generate_content(prompt)
@@ -62,32 +111,61 @@ class GeminiClient:
                  response_text = response.text # Access the combined text from all parts
             else:
                  # Check for prompt feedback (e.g., blocked due to safety)
-                 print(f"Warning: Gemini text response missing content. Prompt Feedback: {response.prompt_feedback}", file=sys.stderr)
+                 log.warning("Gemini text response missing content. Prompt Feedback: %s", response.prompt_feedback)
                  return None # Indicate blocked/empty response
 
-            print(f"\n--- Raw Gemini Text Response ---\n{response_text}\n--------------------------------")
+            if log.isEnabledFor(logging.DEBUG): # Responses can be tens of KB; skip building the message otherwise
+                log.debug("\n--- Raw Gemini Text Response ---\n%s\n--------------------------------", response_text)
             return response_text.strip()
 
         except Exception as e:
             # Catch other potential errors (API errors, etc.)
-            print(f"Error during Gemini API call for text generation: {e}", file=sys.stderr)
-            print(f"Exception Type: {type(e).__name__}", file=sys.stderr)
+            log.error("Error during Gemini API call for text generation: %s", e)
+            log.error("Exception Type: %s", type(e).__name__)
             # Return None to indicate failure
             return None
 
+    def generate_json(self, prompt):
+        """Sends a prompt that asks for a JSON reply and returns the parsed object, or None on failure."""
+        response_text = self.generate_text(prompt)
+        if not response_text:
+            return None
+        try:
+            return _json_loads(_strip_json_fences(response_text))
+        except ValueError as e:
+            log.warning("Could not decode JSON response from Gemini: %s", e)
+            return None
+
+    def count_tokens(self, text):
+        """Returns the model's token count for text, or None if it could not be counted.
+        Counts are memoized by a digest of the text (so large inputs aren't kept alive as keys),
+        since the same summary input may be checked more than once.
+        """
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        if key in self._token_counts:
+            return self._token_counts[key]
+        try:
+            token_count = self.model.count_tokens(text).total_tokens
+        except Exception as e:
+            log.warning("Could not count tokens with Gemini: %s", e)
+            return None
+        self._token_counts[key] = token_count
+        return token_count
+
+    async def generate_text_async(self, prompt):
+        """Async variant of generate_text; runs the blocking SDK call in a worker thread."""
+        return await asyncio.to_thread(self.generate_text, prompt)
+
     def get_review(self, prompt):
         """Sends the prompt to Gemini and expects a JSON response."""
         if not self.model:
             # This should ideally not be reached due to __init__ checks
-            print("Error: Gemini model not initialized.", file=sys.stderr)
+            log.error("Gemini model not initialized.")
             return {"reviews": []}
 
         response_text = None
         try:
-            print(f"\n--- Sending Prompt to Gemini ({self.model_name}) ---")
-            # print(prompt) # Keep prompt logging minimal unless debugging
-            print("Prompt length:", len(prompt), "chars")
-            print("-------------------------------------------------")
+            log.debug("Sending review prompt to Gemini (%s), prompt length: %d chars", self.model_name, len(prompt))
 
             # Make the API call
             # Use generate_content for direct text prompting
@@ -100,53 +178,54 @@ class GeminiClient:
                  response_text = response.text # Access the combined text from all parts
             else:
                  # Check for prompt feedback (e.g., blocked due to safety)
-                 print(f"Warning: Gemini response missing content. Prompt Feedback: {response.prompt_feedback}", file=sys.stderr)
+                 log.warning("Gemini response missing content. Prompt Feedback: %s", response.prompt_feedback)
                  return {"reviews": []} # Return empty if blocked or no response
                  
             # Clean the response: Sometimes Gemini might add ```json ... ``` markers
-            response_text = response_text.strip().removeprefix("```json").removesuffix("```").strip()
+            response_text = _strip_json_fences(response_text)
 
-            print(f"\n--- Raw Gemini Response (cleaned) ---\n{response_text}\n------------------------------------")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("\n--- Raw Gemini Response (cleaned) ---\n%s\n------------------------------------", response_text)
 
             # Parse the JSON response
-            review_data = json.loads(response_text)
+            review_data = _json_loads(response_text)
 
             # Basic validation of the response structure
             if "reviews" not in review_data or not isinstance(review_data["reviews"], list):
-                 print(f"Warning: Invalid JSON response format from Gemini: 'reviews' key missing or not a list. Response: {response_text}", file=sys.stderr)
+                 log.warning("Invalid JSON response format from Gemini: 'reviews' key missing or not a list. Response: %s", response_text)
                  return {"reviews": []} # Return empty on format error
 
-            # Validate individual review items
-            valid_reviews = []
-            for item in review_data["reviews"]:
-                if not isinstance(item, dict) or not all(k in item for k in ("lineNumber", "reviewComment")):
-                    print(f"Warning: Invalid review item format: {item}. Missing keys.", file=sys.stderr)
-                    continue # Skip invalid item
-                if not isinstance(item["lineNumber"], int):
-                    print(f"Warning: Invalid review item format: {item}. 'lineNumber' not an integer.", file=sys.stderr)
-                    continue # Skip invalid item
-                if not isinstance(item["reviewComment"], str) or not item["reviewComment"].strip():
-                    print(f"Warning: Invalid review item format: {item}. 'reviewComment' not a non-empty string.", file=sys.stderr)
-                    continue # Skip invalid item
-                valid_reviews.append(item)
+            # Validate individual review items in one pass; report rejections as a single count
+            reviews = review_data["reviews"]
+            valid_reviews = [
+                item for item in reviews
+                if isinstance(item, dict)
+                and isinstance(item.get("lineNumber"), int)
+                and isinstance(item.get("reviewComment"), str)
+                and item["reviewComment"].strip()
+            ]
+            rejected = len(reviews) - len(valid_reviews)
+            if rejected:
+                log.warning("Rejected %s invalid review item(s) (need integer 'lineNumber' and non-empty string 'reviewComment').", rejected)
 
             return {"reviews": valid_reviews}
 
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON response from Gemini: {e}", file=sys.stderr)
-            print(f"Raw response text was: {response_text}", file=sys.stderr)
+        except ValueError as e: # json.JSONDecodeError and orjson.JSONDecodeError both subclass ValueError
+            log.error("Error decoding JSON response from Gemini: %s", e)
+            log.error("Raw response text was: %s", response_text)
             return {"reviews": []}
         except Exception as e:
             # Catch other potential errors (API errors, validation errors, etc.)
-            print(f"Error during Gemini API call or processing: {e}", file=sys.stderr)
+            log.error("Error during Gemini API call or processing: %s", e)
             # Log the specific exception type for better debugging
-            print(f"Exception Type: {type(e).__name__}", file=sys.stderr)
+            log.error("Exception Type: %s", type(e).__name__)
             if response_text: # If we got some text before the error
-                print(f"Response text before error: {response_text}", file=sys.stderr)
+                log.error("Response text before error: %s", response_text)
             return {"reviews": []}
 
 # Example usage (for testing)
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     # Requires GEMINI_API_KEY env var set for testing
     if os.getenv("GEMINI_API_KEY"):
         try:
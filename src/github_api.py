@@ -1,10 +1,88 @@
 # src/github_api.py - Functions for interacting with the GitHub API
 
 import os
+import base64
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time # Import time for potential rate limiting
-import sys # Needed for stderr prints in main
+import sys
+import logging
+import atexit
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, urlencode
+
+log = logging.getLogger(__name__)
+
+# Prefer orjson for (de)serializing API payloads; fall back to the stdlib if unavailable.
+# Both helpers work on bytes, which requests accepts directly as a request body.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    def _json_dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+def _serialize_json_body(json_body):
+    """Serializes a request payload to bytes.
+    The common {"body": str} comment payload only needs its string escaped, skipping the generic dict walk.
+    """
+    if len(json_body) == 1 and isinstance(json_body.get("body"), str):
+        return b'{"body":' + _json_dumps(json_body["body"]) + b'}'
+    return _json_dumps(json_body)
+
+# Max concurrent page fetches when paginating list endpoints
+MAX_PAGE_FETCH_WORKERS = 8
+
+# Encoded byte needles for find_comment_with_tag, keyed by tag (the summary tag is fixed per process)
+_TAG_BYTES_CACHE = {}
+
+def _tag_needle(tag):
+    """Returns the tag as it appears inside a JSON string (quotes/backslashes escaped, UTF-8 kept raw)."""
+    needle = _TAG_BYTES_CACHE.get(tag)
+    if needle is None:
+        needle = _TAG_BYTES_CACHE.setdefault(tag, json.dumps(tag, ensure_ascii=False)[1:-1].encode("utf-8"))
+    return needle
+
+# Single GraphQL query replacing the metadata + comment-listing REST round-trips.
+# files/comments are capped; callers fall back to REST when the caps are exceeded.
+PR_BUNDLE_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      title
+      body
+      baseRefOid
+      headRefOid
+      comments(last: 50) { totalCount nodes { fullDatabaseId body } }
+    }
+  }
+}
+"""
+
+# Max number of (path, ref) file contents kept in memory by get_file_content
+FILE_CONTENT_CACHE_SIZE = 128
+# Max concurrent blob downloads in get_blobs_for_paths
+MAX_BLOB_FETCH_WORKERS = 16
+
+# Per-PR memo of the tagged summary comment's ID, so later runs skip paging through all comments
+COMMENT_ID_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "gemini-review")
+
+# On-disk ETag cache for conditional GETs (304 responses don't count against the rate limit).
+# Kept next to the other caches so it survives between jobs when the cache dir is restored.
+ETAG_CACHE_PATH = os.path.join(COMMENT_ID_CACHE_DIR, "etag.json")
+MAX_ETAG_CACHE_ENTRY_BYTES = 256 * 1024 # Don't cache large bodies (e.g., huge compare payloads)
+MAX_ETAG_CACHE_ENTRIES = 256
+MAX_ETAG_CACHE_BYTES = 4 * 1024 * 1024 # Total body bytes kept; least recently used entries are evicted first
+# Only the mutable PR endpoints are revalidated. Git blobs/trees are content-addressed (nothing to
+# revalidate) and would put repository contents on disk, so they are never cached.
+_ETAG_CACHEABLE_PATH_RE = re.compile(r"/(?:pulls/\d+|issues/\d+/comments|issues/comments/\d+|compare/[^/]+)$")
 
 
 class GitHubAPI:
@@ -16,6 +94,11 @@ class GitHubAPI:
         if not self.repo:
             raise ValueError("GITHUB_REPOSITORY environment variable not set.")
         self.api_base_url = os.getenv("GITHUB_API_URL", "https://api.github.com") # Default to public GitHub API
+        self._repo_url = f"{self.api_base_url}/repos/{self.repo}" # Common prefix for all repo endpoints
+        # GHES serves GraphQL at /api/graphql next to the /api/v3 REST root
+        default_graphql_url = (self.api_base_url[:-len("/v3")] + "/graphql" if self.api_base_url.endswith("/api/v3")
+                               else f"{self.api_base_url}/graphql")
+        self.graphql_url = os.getenv("GITHUB_GRAPHQL_URL", default_graphql_url)
 
         self.headers = {
             "Authorization": f"token {self.token}",
@@ -23,59 +106,181 @@ class GitHubAPI:
             "Accept": "application/vnd.github.v3+json",
         }
 
-    def _make_request(self, method, url, headers=None, params=None, data=None, expected_status=None):
-        """Helper function to make requests and handle common errors."""
+        # Reuse one pooled session so paginated/multi-call flows keep the
+        # TCP+TLS connection alive instead of re-handshaking per request.
+        # Transient gateway errors are retried by the adapter with backoff.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        # Sized for the parallel blob/content fetches and review-phase worker threads
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # LRU of {cache_key: (etag, link_header, body_bytes)} for conditional GETs, persisted across runs.
+        # The Link header is kept so a 304 still drives pagination. Guarded for use from worker threads.
+        self._etag_cache = OrderedDict()
+        self._etag_cache_bytes = 0
+        self._etag_cache_lock = threading.Lock()
+        for key, entry in self._load_etag_cache():
+            # Skip entries written before the endpoint allowlist / size cap existed
+            if self._is_etag_cacheable(key.split(" ", 1)[-1].split("?", 1)[0]) and len(entry[2]) <= MAX_ETAG_CACHE_ENTRY_BYTES:
+                self._store_etag_entry(key, entry)
+        atexit.register(self.save_etag_cache)
+
+        # LRU of {(file_path, ref): content} for get_file_content; guarded for use from worker threads
+        self._file_cache = OrderedDict()
+        self._file_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _load_etag_cache():
+        """Returns the persisted ETag cache as a list of (key, entry) pairs, least recently used first.
+        Bodies are stored base64-encoded. A missing or unreadable cache yields an empty list.
+        """
+        try:
+            with open(ETAG_CACHE_PATH, 'r') as f:
+                stored = json.load(f)
+            return [(key, (etag, link, base64.b64decode(body))) for key, (etag, link, body) in stored.items()]
+        except (OSError, ValueError, TypeError, AttributeError):
+            return []
+
+    def _store_etag_entry(self, key, entry):
+        """Inserts entry as most recently used, evicting the oldest entries past the count/byte caps.
+        Caller must hold _etag_cache_lock (or be the constructor).
+        """
+        old = self._etag_cache.pop(key, None)
+        if old:
+            self._etag_cache_bytes -= len(old[2])
+        self._etag_cache[key] = entry
+        self._etag_cache_bytes += len(entry[2])
+        while len(self._etag_cache) > MAX_ETAG_CACHE_ENTRIES or self._etag_cache_bytes > MAX_ETAG_CACHE_BYTES:
+            _, evicted = self._etag_cache.popitem(last=False)
+            self._etag_cache_bytes -= len(evicted[2])
+
+    def save_etag_cache(self):
+        """Atomically persists the ETag cache (owner-only permissions) so later runs can reuse it.
+        Failures are non-fatal.
+        """
+        with self._etag_cache_lock:
+            if not self._etag_cache:
+                return
+            stored = {key: (etag, link, base64.b64encode(body).decode("ascii"))
+                      for key, (etag, link, body) in self._etag_cache.items()}
+        tmp_path = f"{ETAG_CACHE_PATH}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(ETAG_CACHE_PATH), mode=0o700, exist_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, ETAG_CACHE_PATH)
+        except OSError as e:
+            log.warning("Could not save GitHub ETag cache to %s: %s", ETAG_CACHE_PATH, e)
+
+    @staticmethod
+    def _is_etag_cacheable(url):
+        """True for the endpoints the ETag cache revalidates (see _ETAG_CACHEABLE_PATH_RE)."""
+        return _ETAG_CACHEABLE_PATH_RE.search(urlparse(url).path) is not None
+
+    @staticmethod
+    def _etag_cache_key(url, headers, params):
+        """Cache key for a GET: the media type matters since one URL can serve JSON or a diff."""
+        query = urlencode(sorted(params.items())) if params else ""
+        return f"{headers.get('Accept', '')} {url}?{query}"
+
+    def _make_request(self, method, url, headers=None, params=None, data=None, expected_status=None, return_response=False, json_body=None):
+        """Helper function to make requests and handle common errors.
+        If return_response is True, the raw requests.Response is returned on success
+        (e.g., to inspect pagination headers) instead of the parsed JSON body.
+        json_body (dict) is serialized straight to bytes and sent as application/json.
+        """
         if headers is None:
             headers = self.headers
+        if json_body is not None:
+            data = _serialize_json_body(json_body)
+            headers = {**headers, "Content-Type": "application/json"}
+
+        # Conditional GET: revalidate a previously seen body instead of re-downloading it
+        cache_key = None
+        cached = None
+        if method.upper() == "GET" and self._is_etag_cacheable(url):
+            cache_key = self._etag_cache_key(url, headers, params)
+            with self._etag_cache_lock:
+                cached = self._etag_cache.get(cache_key)
+                if cached:
+                    self._etag_cache.move_to_end(cache_key)
+            if cached:
+                headers = {**headers, "If-None-Match": cached[0]}
+
         try:
-            response = requests.request(method, url, headers=headers, params=params, data=data)
+            response = self.session.request(method, url, headers=headers, params=params, data=data)
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
+            if cache_key:
+                if response.status_code == 304 and cached:
+                    # Not modified: serve the cached body (and its pagination links) through the normal response path
+                    _, link, response._content = cached
+                    if link:
+                        response.headers["Link"] = link
+                    else:
+                        response.headers.pop("Link", None)
+                    response.status_code = 200
+                elif response.status_code == 200 and response.headers.get("ETag") \
+                        and len(response.content) <= MAX_ETAG_CACHE_ENTRY_BYTES:
+                    entry = (response.headers["ETag"], response.headers.get("Link"), response.content)
+                    with self._etag_cache_lock:
+                        self._store_etag_entry(cache_key, entry)
+
             # Check if the expected status code matches, if provided
             if expected_status and response.status_code != expected_status:
-                 print(f"Warning: Expected status {expected_status} but got {response.status_code} for {method} {url}")
+                 log.warning("Expected status %s but got %s for %s %s", expected_status, response.status_code, method, url)
                  # Decide if this should be an error or just a warning
 
             # Basic rate limit check
             if 'X-RateLimit-Remaining' in response.headers:
                 remaining = int(response.headers['X-RateLimit-Remaining'])
                 if remaining < 10:
-                    print(f"Warning: Low GitHub API rate limit remaining: {remaining}")
+                    log.warning("Low GitHub API rate limit remaining: %s", remaining)
             
+            if return_response:
+                return response
+
             # Return JSON if response has content, else True for success on non-GET/HEAD
             if response.status_code == 204: # No Content
                 return True
             if method.upper() in ["GET", "HEAD"] or response.content:
-                return response.json()
+                return _json_loads(response.content)
             else:
                 return True # Success for POST/PATCH/DELETE with no body
 
         except requests.exceptions.HTTPError as e:
             # Log specific details for common errors
             if e.response.status_code == 401:
-                 print(f"GitHub API Error: 401 Unauthorized. Check your GITHUB_TOKEN permissions for {method} {url}.", file=sys.stderr)
+                 log.error("GitHub API Error: 401 Unauthorized. Check your GITHUB_TOKEN permissions for %s %s.", method, url)
             elif e.response.status_code == 403:
-                 print(f"GitHub API Error: 403 Forbidden. Check permissions or rate limits for {method} {url}.", file=sys.stderr)
+                 log.error("GitHub API Error: 403 Forbidden. Check permissions or rate limits for %s %s.", method, url)
                  if 'X-RateLimit-Remaining' in e.response.headers and int(e.response.headers['X-RateLimit-Remaining']) == 0:
                       reset_time = int(e.response.headers.get('X-RateLimit-Reset', 'unknown'))
-                      print(f"Rate limit likely exceeded. Resets at epoch {reset_time}.", file=sys.stderr)
+                      log.error("Rate limit likely exceeded. Resets at epoch %s.", reset_time)
             elif e.response.status_code == 404:
-                 print(f"GitHub API Error: 404 Not Found for {method} {url}", file=sys.stderr)
+                 log.error("GitHub API Error: 404 Not Found for %s %s", method, url)
             else:
-                 print(f"GitHub API HTTP Error ({e.response.status_code}) for {method} {url}: {e}", file=sys.stderr)
-            print(f"Response body: {e.response.text}", file=sys.stderr)
+                 log.error("GitHub API HTTP Error (%s) for %s %s: %s", e.response.status_code, method, url, e)
+            log.error("Response body: %s", e.response.text)
             return None # Indicate failure
         except requests.exceptions.RequestException as e:
-            print(f"GitHub API Request Error for {method} {url}: {e}", file=sys.stderr)
+            log.error("GitHub API Request Error for %s %s: %s", method, url, e)
+            return None # Indicate failure
+        except ValueError as e: # Malformed JSON body (orjson/json decode errors subclass ValueError)
+            log.error("GitHub API returned invalid JSON for %s %s: %s", method, url, e)
             return None # Indicate failure
 
     def get_pr_metadata(self, pr_number):
         """Fetches essential PR details: title, description, base SHA, head SHA."""
-        pr_url = f"{self.api_base_url}/repos/{self.repo}/pulls/{pr_number}"
+        pr_url = f"{self._repo_url}/pulls/{pr_number}"
         pr_data = self._make_request("GET", pr_url)
 
         if not pr_data:
-            print(f"Error: Could not fetch metadata for PR #{pr_number}.")
+            log.error("Could not fetch metadata for PR #%s.", pr_number)
             return None
 
         return {
@@ -85,15 +290,61 @@ class GitHubAPI:
             "head_sha": pr_data.get("head", {}).get("sha"),
         }
 
-    def compare_commits(self, base_sha, head_sha):
-        """Gets the comparison between two commits, including diff data."""
-        compare_url = f"{self.api_base_url}/repos/{self.repo}/compare/{base_sha}...{head_sha}"
-        
+    def get_pr_bundle(self, pr_number):
+        """Fetches PR metadata and recent issue comments in one GraphQL request.
+
+        Returns a dict with the get_pr_metadata keys plus:
+            'comments': list of {'id', 'body'} for the last 50 comments, oldest first,
+                        where 'id' is the REST comment ID usable with update_comment
+                        (None if the server did not report it; look the comment up via REST then),
+            'comments_total': total issue comment count.
+        Or None on failure, in which case callers should use the REST methods.
+        """
+        owner, name = self.repo.split("/", 1)
+        payload = {"query": PR_BUNDLE_QUERY, "variables": {"owner": owner, "name": name, "number": int(pr_number)}}
+        result = self._make_request("POST", self.graphql_url, json_body=payload)
+
+        if not result or result.get("errors"):
+            log.warning("Could not fetch PR bundle via GraphQL for PR #%s: %s", pr_number, result.get('errors') if result else 'request failed')
+            return None
+        pr_data = ((result.get("data") or {}).get("repository") or {}).get("pullRequest")
+        if not pr_data:
+            log.error("GraphQL returned no pull request data for PR #%s.", pr_number)
+            return None
+
+        comments = pr_data.get("comments") or {}
+        return {
+            "title": pr_data.get("title", ""),
+            "description": pr_data.get("body", ""),
+            "base_sha": pr_data.get("baseRefOid"),
+            "head_sha": pr_data.get("headRefOid"),
+            # fullDatabaseId is a BigInt serialized as a string; databaseId can overflow Int for new comments
+            "comments": [{"id": int(c["fullDatabaseId"]) if c.get("fullDatabaseId") else None, "body": c.get("body", "")}
+                         for c in comments.get("nodes") or []],
+            "comments_total": comments.get("totalCount", 0),
+        }
+
+    def compare_commits(self, base_sha, head_sha, fmt="json"):
+        """Gets the comparison between two commits, including diff data.
+        With fmt="json" (default) returns the parsed comparison object ('files', 'commits', ...).
+        With fmt="diff" returns only the unified diff text, skipping the (much larger) JSON payload.
+        """
+        compare_url = f"{self._repo_url}/compare/{base_sha}...{head_sha}"
+
+        if fmt == "diff":
+            diff_headers = self.headers.copy()
+            diff_headers["Accept"] = "application/vnd.github.diff"
+            response = self._make_request("GET", compare_url, headers=diff_headers, return_response=True)
+            if response is None:
+                log.error("Error fetching diff for %s...%s", base_sha, head_sha)
+                return None
+            return response.text
+
         # Request JSON response which includes files array with patch data
         comparison_data = self._make_request("GET", compare_url)
 
         if not comparison_data:
-            print(f"Error comparing commits {base_sha}...{head_sha}")
+            log.error("Error comparing commits %s...%s", base_sha, head_sha)
             return None
         
         # TODO: Consider handling cases where comparison status is not 'ahead' or 'diverged'
@@ -101,52 +352,126 @@ class GitHubAPI:
 
         return comparison_data # Contains 'files', 'commits', etc.
 
-    def find_comment_with_tag(self, pr_number, tag):
-        """Finds the first issue comment containing a specific tag."""
-        comments_url = f"{self.api_base_url}/repos/{self.repo}/issues/{pr_number}/comments"
-        page = 1
-        per_page = 100 # Max allowed by GitHub API
-
-        while True:
-            params = {"page": page, "per_page": per_page}
-            comments_page = self._make_request("GET", comments_url, params=params)
-
-            if not comments_page: # Error occurred or no comments found at all
-                print(f"Error fetching comments or no comments found for PR #{pr_number}.")
-                return None
+    @staticmethod
+    def _last_page_from_links(response):
+        """Returns the page number of the rel="last" Link header, or None if absent."""
+        last_url = response.links.get("last", {}).get("url")
+        if not last_url:
+            return None
+        try:
+            return int(parse_qs(urlparse(last_url).query)["page"][0])
+        except (KeyError, IndexError, ValueError):
+            return None
 
-            for comment in comments_page:
-                if comment.get("body") and tag in comment["body"]:
-                    print(f"Found comment (ID: {comment['id']}) with tag '{tag}'")
-                    return comment # Return the full comment object
+    @staticmethod
+    def _find_tag_in_page(raw_page, needle, tag):
+        """Returns the first comment in the raw JSON page whose body contains the tag, or None.
+        A C-level substring probe on the raw bytes rules out most pages before any JSON parsing.
+        """
+        if needle not in raw_page:
+            return None
+        for comment in _json_loads(raw_page):
+            if comment.get("body") and tag in comment["body"]:
+                return comment
+        return None
 
-            # Check if this was the last page
-            if len(comments_page) < per_page:
-                break # No more pages
+    def find_comment_with_tag(self, pr_number, tag):
+        """Finds the first issue comment containing a specific tag.
+        The comment ID found by an earlier run is tried first (one request, verified to still
+        carry the tag); otherwise the PR's comments are scanned and the ID found is remembered.
+        """
+        cache_path = os.path.join(COMMENT_ID_CACHE_DIR, f"pr-{pr_number}.json")
+        cache_key = f"{self.repo}:{tag}"
+        try:
+            with open(cache_path, 'r') as f:
+                cached_ids = json.load(f)
+        except (OSError, ValueError):
+            cached_ids = {}
+
+        cached_id = cached_ids.get(cache_key)
+        if cached_id:
+            comment = self._make_request("GET", f"{self._repo_url}/issues/comments/{cached_id}")
+            if comment and tag in (comment.get('body') or "") \
+                    and (comment.get('issue_url') or "").endswith(f"/issues/{pr_number}"):
+                log.info("Found comment (ID: %s) with tag '%s' from cache", cached_id, tag)
+                return comment
+
+        comment = self._scan_comments_for_tag(pr_number, tag)
+        found_id = comment.get('id') if comment else None
+        if found_id != cached_id: # Remember the new ID, or forget a stale one
+            if found_id:
+                cached_ids[cache_key] = found_id
+            else:
+                cached_ids.pop(cache_key, None)
+            tmp_path = cache_path + ".tmp"
+            try:
+                os.makedirs(COMMENT_ID_CACHE_DIR, exist_ok=True)
+                with open(tmp_path, 'w') as f:
+                    json.dump(cached_ids, f)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                log.warning("Could not cache comment ID to %s: %s", cache_path, e)
+        return comment
+
+    def _scan_comments_for_tag(self, pr_number, tag):
+        """Scans the PR's issue comments for the first one containing tag.
+        The first page is fetched alone; if the Link header reports more pages,
+        the remaining pages are fetched concurrently and scanned in order.
+        Pages whose raw body does not contain the tag are skipped without JSON parsing.
+        """
+        comments_url = f"{self._repo_url}/issues/{pr_number}/comments"
+        per_page = 100 # Max allowed by GitHub API
+        needle = _tag_needle(tag)
 
-            page += 1
-            # Optional: Add a small delay to avoid hitting secondary rate limits
-            # time.sleep(0.1)
+        response = self._make_request("GET", comments_url, params={"page": 1, "per_page": per_page}, return_response=True)
+        if response is None: # Error occurred
+            log.error("Error fetching comments for PR #%s.", pr_number)
+            return None
 
-        print(f"No comment found with tag '{tag}' for PR #{pr_number}.")
+        comment = self._find_tag_in_page(response.content, needle, tag)
+        if comment:
+            log.info("Found comment (ID: %s) with tag '%s'", comment['id'], tag)
+            return comment # Return the full comment object
+
+        last_page = self._last_page_from_links(response)
+        if last_page and last_page > 1:
+            with ThreadPoolExecutor(max_workers=MAX_PAGE_FETCH_WORKERS) as executor:
+                futures = [
+                    executor.submit(self._make_request, "GET", comments_url,
+                                    params={"page": page, "per_page": per_page}, return_response=True)
+                    for page in range(2, last_page + 1)
+                ]
+                # Scan in page order so the *first* matching comment wins
+                for future in futures:
+                    response = future.result()
+                    if response is None:
+                        log.error("Error fetching comments for PR #%s.", pr_number)
+                        executor.shutdown(cancel_futures=True)
+                        return None
+                    comment = self._find_tag_in_page(response.content, needle, tag)
+                    if comment:
+                        log.info("Found comment (ID: %s) with tag '%s'", comment['id'], tag)
+                        executor.shutdown(cancel_futures=True) # Drop pages not yet fetched
+                        return comment
+
+        log.info("No comment found with tag '%s' for PR #%s.", tag, pr_number)
         return None
 
     def update_comment(self, comment_id, body):
         """Updates an existing issue comment."""
-        comment_url = f"{self.api_base_url}/repos/{self.repo}/issues/comments/{comment_id}"
-        payload = json.dumps({"body": body})
-        result = self._make_request("PATCH", comment_url, data=payload)
+        comment_url = f"{self._repo_url}/issues/comments/{comment_id}"
+        result = self._make_request("PATCH", comment_url, json_body={"body": body})
         if result:
-            print(f"Successfully updated comment ID {comment_id}")
+            log.info("Successfully updated comment ID %s", comment_id)
             return result
         else:
-            print(f"Error updating comment ID {comment_id}")
+            log.error("Error updating comment ID %s", comment_id)
             return None
 
     def create_review(self, pr_number, commit_id, comments, body="", event="COMMENT"):
         """Creates a pull request review with multiple comments."""
         # comments should be a list of dicts: [{"path": "file.py", "line": 10, "body": "comment text"}, ...]
-        reviews_url = f"{self.api_base_url}/repos/{self.repo}/pulls/{pr_number}/reviews"
+        reviews_url = f"{self._repo_url}/pulls/{pr_number}/reviews"
         payload = {
             "commit_id": commit_id,
             "body": body, # Overall review summary
@@ -157,28 +482,92 @@ class GitHubAPI:
         # Filter out any potentially empty comments just in case
         valid_comments = [c for c in comments if c.get("body")]
         if len(valid_comments) != len(comments):
-             print(f"Warning: Filtered out {len(comments) - len(valid_comments)} empty comments before creating review.")
+             log.warning("Filtered out %s empty comments before creating review.", len(comments) - len(valid_comments))
         payload["comments"] = valid_comments
 
         # Don't submit a review if there are no comments and no body
         if not payload["comments"] and not payload["body"]:
-             print("Skipping review creation: No comments and no summary body provided.")
+             log.info("Skipping review creation: No comments and no summary body provided.")
              return None
 
-        result = self._make_request("POST", reviews_url, data=json.dumps(payload))
+        result = self._make_request("POST", reviews_url, json_body=payload)
 
         if result:
-            print(f"Successfully created review for PR #{pr_number} on commit {commit_id[:7]}")
+            log.info("Successfully created review for PR #%s on commit %s", pr_number, commit_id[:7])
             return result
         else:
-            print(f"Error creating review for PR #{pr_number}")
+            log.error("Error creating review for PR #%s", pr_number)
             return None
 
     # --- Existing methods (potentially need adjustments later) ---
 
     def get_file_content(self, file_path, ref):
-        """Fetches the raw content of a file at a specific ref (commit SHA, branch, etc.)."""
-        content_url = f"{self.api_base_url}/repos/{self.repo}/contents/{file_path}"
+        """Fetches the raw content of a file at a specific ref (commit SHA, branch, etc.).
+        Results are cached per (file_path, ref); callers pass commit SHAs, which are immutable.
+        Fetch errors (None) are not cached so they can be retried.
+        """
+        cache_key = (file_path, ref)
+        with self._file_cache_lock:
+            if cache_key in self._file_cache:
+                self._file_cache.move_to_end(cache_key)
+                return self._file_cache[cache_key]
+
+        content = self._fetch_file_content(file_path, ref)
+        if content is not None:
+            self._cache_file_content(cache_key, content)
+        return content
+
+    def _cache_file_content(self, cache_key, content):
+        with self._file_cache_lock:
+            self._file_cache[cache_key] = content
+            self._file_cache.move_to_end(cache_key)
+            if len(self._file_cache) > FILE_CONTENT_CACHE_SIZE:
+                self._file_cache.popitem(last=False) # Evict least recently used
+
+    def get_blobs_for_paths(self, paths, commit_sha):
+        """Fetches the contents of many files at one commit: {path: content}.
+        Resolves every path's blob SHA with a single recursive Git Trees call, then downloads the
+        blobs concurrently. Values follow get_file_content: "" if the path doesn't exist, None on error.
+        Paths missing from a truncated tree (very large repos) fall back to get_file_content.
+        """
+        paths = list(dict.fromkeys(paths))
+        tree_url = f"{self._repo_url}/git/trees/{commit_sha}"
+        tree_data = self._make_request("GET", tree_url, params={"recursive": "1"})
+
+        wanted = set(paths)
+        blob_shas = {}
+        if tree_data:
+            blob_shas = {entry['path']: entry['sha'] for entry in tree_data.get('tree', [])
+                         if entry.get('type') == 'blob' and entry.get('path') in wanted}
+        else:
+            log.warning("Could not fetch tree for %s, fetching file contents individually.", commit_sha)
+        tree_complete = bool(tree_data) and not tree_data.get('truncated')
+
+        def fetch(path):
+            if path in blob_shas:
+                content = self._fetch_blob(blob_shas[path], path)
+                if content is not None:
+                    self._cache_file_content((path, commit_sha), content)
+                return content
+            if tree_complete:
+                log.warning("File not found at path '%s' for ref '%s'. It might be a new file.", path, commit_sha)
+                return ""
+            return self.get_file_content(path, commit_sha)
+
+        with ThreadPoolExecutor(max_workers=MAX_BLOB_FETCH_WORKERS) as executor:
+            return dict(zip(paths, executor.map(fetch, paths)))
+
+    def _fetch_blob(self, blob_sha, path):
+        """Downloads a blob by SHA and decodes its base64 content as text, or returns None on error."""
+        blob_data = self._make_request("GET", f"{self._repo_url}/git/blobs/{blob_sha}")
+        if not blob_data or blob_data.get('encoding') != 'base64':
+            log.error("Error fetching blob %s for %s", blob_sha, path)
+            return None
+        return base64.b64decode(blob_data['content']).decode("utf-8", errors="replace")
+
+    def _fetch_file_content(self, file_path, ref):
+        """Fetches file content from the API: the text, "" if not found, or None on error."""
+        content_url = f"{self._repo_url}/contents/{file_path}"
         query_params = {"ref": ref}
 
         # Override default headers for raw content
@@ -186,32 +575,31 @@ class GitHubAPI:
         raw_headers["Accept"] = "application/vnd.github.raw"
 
         try:
-            response = requests.get(content_url, headers=raw_headers, params=query_params)
+            response = self.session.get(content_url, headers=raw_headers, params=query_params)
             response.raise_for_status()
             return response.text
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
-                print(f"Warning: File not found at path '{file_path}' for ref '{ref}'. It might be a new file.")
+                log.warning("File not found at path '%s' for ref '%s'. It might be a new file.", file_path, ref)
                 return "" # Return empty string for new/deleted files at this ref
             else:
-                print(f"Error fetching file content for {file_path} at ref {ref}: {e}", file=sys.stderr)
-                print(f"Response body: {e.response.text}", file=sys.stderr)
+                log.error("Error fetching file content for %s at ref %s: %s", file_path, ref, e)
+                log.error("Response body: %s", e.response.text)
                 return None # Indicate a fetch error
         except requests.exceptions.RequestException as e:
-            print(f"Error fetching file content for {file_path} at ref {ref}: {e}", file=sys.stderr)
+            log.error("Error fetching file content for %s at ref %s: %s", file_path, ref, e)
             return None # Indicate a fetch error
 
     def post_pr_comment(self, pr_number, body):
         """Posts a general comment on the Pull Request (issue comment)."""
-        issue_comment_url = f"{self.api_base_url}/repos/{self.repo}/issues/{pr_number}/comments"
-        payload = json.dumps({"body": body})
-        result = self._make_request("POST", issue_comment_url, data=payload)
+        issue_comment_url = f"{self._repo_url}/issues/{pr_number}/comments"
+        result = self._make_request("POST", issue_comment_url, json_body={"body": body})
 
         if result:
-            print(f"Successfully posted comment to PR #{pr_number}")
+            log.info("Successfully posted comment to PR #%s", pr_number)
             return result
         else:
-            print(f"Error posting comment to PR #{pr_number}")
+            log.error("Error posting comment to PR #%s", pr_number)
             return None
     
     # --- Potentially deprecated methods (keep for now, review later) ---
@@ -219,7 +607,7 @@ class GitHubAPI:
     def _get_pr_full_diff_legacy(self, pr_number):
         """LEGACY: Fetches PR title, description, and FULL diff."""
         # Kept temporarily, should switch to get_pr_metadata + compare_commits
-        pr_url = f"{self.api_base_url}/repos/{self.repo}/pulls/{pr_number}"
+        pr_url = f"{self._repo_url}/pulls/{pr_number}"
         diff_url = f"{pr_url}.diff"
         
         pr_details = None
@@ -229,9 +617,9 @@ class GitHubAPI:
             # Get PR metadata (title, body)
             json_headers = self.headers.copy()
             json_headers["Accept"] = "application/vnd.github.v3+json"
-            response_pr = requests.get(pr_url, headers=json_headers)
+            response_pr = self.session.get(pr_url, headers=json_headers)
             response_pr.raise_for_status()
-            pr_data = response_pr.json()
+            pr_data = _json_loads(response_pr.content)
             pr_details = {
                 "title": pr_data.get("title", ""),
                 "description": pr_data.get("body", "")
@@ -241,12 +629,12 @@ class GitHubAPI:
             # Get PR diff
             diff_headers = self.headers.copy()
             diff_headers["Accept"] = "application/vnd.github.v3.diff"
-            response_diff = requests.get(diff_url, headers=diff_headers)
+            response_diff = self.session.get(diff_url, headers=diff_headers)
             response_diff.raise_for_status()
             diff_content = response_diff.text
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching PR details (legacy) for #{pr_number}: {e}", file=sys.stderr)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.error("Error fetching PR details (legacy) for #%s: %s", pr_number, e)
             return None, None
 
         return pr_details, diff_content
@@ -255,38 +643,39 @@ class GitHubAPI:
         """LEGACY?: Posts a single review comment. Consider using create_review instead."""
         # This posts comments individually, not as part of a review.
         # Might be useful for immediate feedback but create_review is generally preferred.
-        comments_url = f"{self.api_base_url}/repos/{self.repo}/pulls/{pr_number}/comments"
-        payload = json.dumps({
+        comments_url = f"{self._repo_url}/pulls/{pr_number}/comments"
+        payload = {
             "body": body,
             "commit_id": commit_id,
             "path": path,
             "line": line,
-        })
-        result = self._make_request("POST", comments_url, data=payload)
+        }
+        result = self._make_request("POST", comments_url, json_body=payload)
         if result:
-            print(f"Successfully posted single comment to {path}:{line}")
+            log.info("Successfully posted single comment to %s:%s", path, line)
             return result
         else:
-            print(f"Error posting single comment to {path}:{line}")
+            log.error("Error posting single comment to %s:%s", path, line)
             return None
 
     def get_pr_commit_id(self, pr_number):
         """LEGACY?: Fetches the HEAD commit SHA. Included in get_pr_metadata."""
         # Kept temporarily as main.py uses it. Should be replaced by get_pr_metadata.
-        pr_data = self._make_request("GET", f"{self.api_base_url}/repos/{self.repo}/pulls/{pr_number}")
+        pr_data = self._make_request("GET", f"{self._repo_url}/pulls/{pr_number}")
         if pr_data:
              head_sha = pr_data.get("head", {}).get("sha")
              if head_sha:
                  return head_sha
              else:
-                 print(f"Error: Could not extract head SHA from PR data for #{pr_number}.", file=sys.stderr)
+                 log.error("Could not extract head SHA from PR data for #%s.", pr_number)
                  return None
         else:
-            print(f"Error fetching PR commit ID (legacy) for #{pr_number}: {e}", file=sys.stderr)
+            log.error("Error fetching PR commit ID (legacy) for #%s: %s", pr_number, e)
             return None
 
 # Example usage (for testing)
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
     # Requires GITHUB_TOKEN, GITHUB_REPOSITORY, and PR_NUMBER env vars set for testing
     pr_num_test = os.getenv("PR_NUMBER_TEST")
     if pr_num_test and os.getenv("GITHUB_TOKEN") and os.getenv("GITHUB_REPOSITORY"):
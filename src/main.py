@@ -3,7 +3,18 @@ import os
 import sys
 import json
 import re # Import regex for parsing summary comment
-from functools import lru_cache # For caching file content
+import logging
+import asyncio
+import mmap
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Prefer orjson for parsing the event payload; fall back to the stdlib if unavailable
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # Import our modules
 from github_api import GitHubAPI
@@ -11,22 +22,61 @@ from gemini_client import GeminiClient
 from config import load_config
 # We will need more advanced patch parsing later
 # TODO: Update util imports after utils.py is refactored
-from utils import parse_hunks_from_patch, should_exclude_file # Assume parse_hunks_from_patch exists/will be added
-from utils import map_review_to_file_line # Assume this will be the new mapping function
-from utils import find_best_patch_for_line # Assume this will be the new remapping function
+from utils import parse_hunks_cached, compile_exclude
+from utils import build_hunk_line_map, build_patch_bounds, find_best_patch_line
 from utils import extract_context_around_hunk # Needs verification/update
 
+def _resolve_log_level(value):
+    """Maps LOG_LEVEL (a level name such as "debug", or a number such as "10") to a logging level.
+    Unrecognised values fall back to INFO instead of failing at startup.
+    """
+    value = (value or "").strip()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    return level if isinstance(level, int) else logging.INFO
+
+class _LogFormatter(logging.Formatter):
+    """Bare messages for INFO and below; WARNING and above are prefixed with the level name."""
+    def format(self, record):
+        message = super().format(record)
+        return message if record.levelno < logging.WARNING else f"{record.levelname}: {message}"
+
+# Route module loggers (github_api, gemini_client) to stdout; LOG_LEVEL=DEBUG shows raw Gemini responses
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(_LogFormatter())
+logging.basicConfig(level=_resolve_log_level(os.getenv("LOG_LEVEL")), handlers=[_log_handler])
+log = logging.getLogger("gemini-review")
+
 # Define the trigger command
 TRIGGER_COMMAND = "/gemini-review"
+# The trigger as it can appear in the raw event JSON ("/" may legally be escaped as "\/")
+_TRIGGER_NEEDLES = (TRIGGER_COMMAND.encode(), TRIGGER_COMMAND.replace("/", "\\/").encode())
 
 # --- Constants for Summary Comment ---
 SUMMARY_COMMENT_TAG = "<!-- Gemini Review Summary -->"
-RAW_SUMMARY_START_TAG = "<details><summary>Raw Summary</summary>\\n\\n```text"
-RAW_SUMMARY_END_TAG = "```\\n\\n</details>"
-SHORT_SUMMARY_START_TAG = "<details><summary>Short Summary</summary>\\n\\n"
-SHORT_SUMMARY_END_TAG = "\\n\\n</details>"
+RAW_SUMMARY_START_TAG = "<details><summary>Raw Summary</summary>\n\n```text"
+RAW_SUMMARY_END_TAG = "```\n\n</details>"
+SHORT_SUMMARY_START_TAG = "<details><summary>Short Summary</summary>\n\n"
+SHORT_SUMMARY_END_TAG = "\n\n</details>"
 COMMIT_ID_TAG = "<!-- Last Reviewed Commit: "
 COMMIT_ID_END_TAG = " -->"
+# Summary comment body for runs that find nothing to review; still records the checked head SHA
+NO_CHANGE_COMMENT_FORMAT = SUMMARY_COMMENT_TAG + "\n{message}\n" + COMMIT_ID_TAG + "{head_sha}" + COMMIT_ID_END_TAG
+
+def _tag_regex(tag):
+    # Comments posted by older versions contain a literal backslash-n where the tags now have newlines
+    return re.escape(tag).replace(re.escape("\n"), r"(?:\n|\\n)")
+
+# Compiled once: summary comment section name -> pattern capturing the text between its tags
+_TAG_PATTERNS = {
+    name: re.compile(_tag_regex(start) + r"(.*?)" + _tag_regex(end), re.DOTALL)
+    for name, (start, end) in {
+        'raw': (RAW_SUMMARY_START_TAG, RAW_SUMMARY_END_TAG),
+        'short': (SHORT_SUMMARY_START_TAG, SHORT_SUMMARY_END_TAG),
+        'commit': (COMMIT_ID_TAG, COMMIT_ID_END_TAG),
+    }.items()
+}
 
 # --- Prompt Templates ---
 # Existing review prompt - might need minor tweaks later
@@ -80,12 +130,38 @@ SUMMARIZE_FILE_DIFF_PROMPT = "You are reviewing a code change. Below is the diff
 SUMMARIZE_CHANGESETS_PROMPT = "You are summarizing a pull request. Below are summaries for individual file changes. Combine these into a coherent high-level overview suitable for a changelog or progress report. Group related changes if possible. Focus on the overall impact and key features/fixes introduced.\\n\\nIndividual Summaries:\\n{raw_summary}"
 SUMMARIZE_FINAL_PROMPT = "You are writing a summary for a pull request based on the raw summary of changes below. Write a paragraph or two describing the main goals achieved and key changes made in this update. Target audience is fellow developers and potentially product managers. Avoid excessive technical jargon where possible.\\n\\nRaw Summary:\\n{raw_summary}"
 SUMMARIZE_SHORT_PROMPT = "Provide a very short (1-2 sentence) summary based on this raw summary:\\n{raw_summary}"
-
-# --- Constants for Token Limits (using character count as proxy) ---
-# TODO: Move these to config.py and potentially use a proper tokenizer
+# Produces the refined, final and short summaries in a single call; the three prompts above are the fallback
+SUMMARIZE_ALL_PROMPT = """You are summarizing a pull request. Below are summaries of the changes, oldest first (summaries from later reviews follow "Later Summary:").
+Produce three summaries from them:
+- "refined": combine them into a coherent high-level overview suitable for a changelog or progress report. Group related changes if possible. Focus on the overall impact and key features/fixes introduced.
+- "final": a paragraph or two describing the main goals achieved and key changes made in this update, for fellow developers and potentially product managers. Avoid excessive technical jargon where possible.
+- "short": a very short (1-2 sentence) summary.
+
+Respond *only* with a JSON object of the form:
+{{"refined": "...", "final": "...", "short": "..."}}
+
+Summaries:
+{raw_summary}"""
+
+# --- Constants for Token Limits ---
+# Inputs within the character limit are sent as-is (no API call needed). Longer inputs are
+# counted with the model's tokenizer and still sent if they fit the token limit.
+# TODO: Move these to config.py
 MAX_CHARS_FILE_SUMMARY_DIFF = 15000
+MAX_TOKENS_FILE_SUMMARY_DIFF = 6000
 MAX_CHARS_RAW_SUMMARY_INPUT = 25000
+MAX_TOKENS_RAW_SUMMARY_INPUT = 10000
 MAX_CHARS_REVIEW_PROMPT = 10000
+MAX_TOKENS_REVIEW_PROMPT = 4000
+
+# Raw summaries from successive runs are kept oldest first, joined by this separator, up to MAX_SUMMARY_HISTORY runs
+SUMMARY_HISTORY_SEPARATOR = "\n\n---\nLater Summary:\n"
+MAX_SUMMARY_HISTORY = 5
+
+# Max Gemini requests in flight at once (network-bound, so calls are overlapped)
+MAX_CONCURRENT_GEMINI_CALLS = 8
+# Worker threads for the per-hunk review calls
+MAX_REVIEW_WORKERS = 16
 
 def build_review_prompt(pr_details, file_path, code_context, hunk_content, custom_instructions, jira_context):
     """Builds the prompt string for reviewing a hunk."""
@@ -100,211 +176,332 @@ def build_review_prompt(pr_details, file_path, code_context, hunk_content, custo
     )
 
 # --- Helper functions for Summary Comment Parsing ---
-def extract_from_tag(text, start_tag, end_tag):
-    start_index = text.find(start_tag)
-    if start_index == -1:
+def parse_summary_sections(body):
+    """Extracts the 'raw', 'short' and 'commit' sections of a summary comment body.
+    Missing or malformed sections are returned as "".
+    """
+    sections = {}
+    for name, pattern in _TAG_PATTERNS.items():
+        match = pattern.search(body)
+        sections[name] = match.group(1).strip() if match else ""
+    return sections
+
+def check_token_budget(gemini, text, max_chars, max_tokens):
+    """Returns None if text is within max_chars, or longer but within max_tokens by the model's count.
+    Otherwise returns why it doesn't fit: "over N tokens", or "token count unavailable" if counting failed.
+    Character length is only a proxy, so long-but-sparse inputs are not skipped needlessly.
+    """
+    if len(text) <= max_chars:
+        return None
+    token_count = gemini.count_tokens(text)
+    if token_count is None:
+        return "token count unavailable"
+    return f"over {max_tokens} tokens" if token_count > max_tokens else None
+
+def review_within_budget(gemini, prompt):
+    """Review worker job: checks the prompt's token budget (which may call the API), then gets the review.
+    Returns (problem, review_result), where problem is the check_token_budget reason if the prompt was skipped.
+    """
+    problem = check_token_budget(gemini, prompt, MAX_CHARS_REVIEW_PROMPT, MAX_TOKENS_REVIEW_PROMPT)
+    return problem, (None if problem else gemini.get_review(prompt))
+
+def summarize_all(gemini, raw_summary):
+    """Gets the refined, final and short summaries from one Gemini call (SUMMARIZE_ALL_PROMPT).
+    Returns a dict with non-empty 'refined', 'final' and 'short' strings, or None if the reply is unusable.
+    """
+    try:
+        summaries = gemini.generate_json(SUMMARIZE_ALL_PROMPT.format(raw_summary=raw_summary))
+    except Exception as e:
+        log.error("  Error generating combined summaries: %s", e)
+        return None
+    if not isinstance(summaries, dict):
+        return None
+    if not all(isinstance(summaries.get(key), str) and summaries[key].strip() for key in ("refined", "final", "short")):
         return None
-    start_index += len(start_tag)
-    end_index = text.find(end_tag, start_index)
-    if end_index == -1:
-        return None # Malformed tag?
-    return text[start_index:end_index].strip()
-
-# LRU Cache decorator to avoid fetching the same file content multiple times
-@lru_cache(maxsize=32) # Cache up to 32 files/refs
-def get_cached_file_content(github_api, file_path, commit_id):
-    print(f"  Fetching content for: {file_path} @ {commit_id[:7]}")
-    return github_api.get_file_content(file_path, commit_id)
+    return {key: summaries[key].strip() for key in ("refined", "final", "short")}
+
+def tail_trim(text, max_chars):
+    """Keeps the last max_chars of text (the newest summaries), starting at a line boundary and marking the cut."""
+    if len(text) <= max_chars:
+        return text
+    cut = len(text) - max_chars
+    line_start = text.find("\n", cut) + 1
+    if 0 < line_start < len(text): # Don't start mid-line unless the kept tail is a single line
+        cut = line_start
+    return "... (Earlier content truncated)\n" + text[cut:]
+
+async def _gather_summaries(gemini, jobs):
+    """Runs the file-summary jobs, given as (file_diff, prompt) pairs, concurrently (bounded by a semaphore).
+    Each job first checks the diff's token budget (counting tokens is an API call, so it runs here too).
+    Returns (problem, summary) pairs in job order, where problem is the check_token_budget reason if the
+    diff was skipped; failed calls yield their exception instead of a pair.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GEMINI_CALLS)
+
+    async def summarize(file_diff, prompt):
+        async with semaphore:
+            problem = await asyncio.to_thread(check_token_budget, gemini, file_diff,
+                                              MAX_CHARS_FILE_SUMMARY_DIFF, MAX_TOKENS_FILE_SUMMARY_DIFF)
+            if problem:
+                return problem, None
+            return None, await gemini.generate_text_async(prompt)
+
+    return await asyncio.gather(*(summarize(file_diff, prompt) for file_diff, prompt in jobs), return_exceptions=True)
+
+def _finalize_no_change(github_api, pr_number, existing_id, head_sha, msg, existing_body=None):
+    """Updates (or creates) the summary comment with msg and the checked head SHA, then exits.
+    If existing_body is given, an existing comment keeps its summaries and only its commit marker is updated.
+    """
+    body = NO_CHANGE_COMMENT_FORMAT.format(message=msg, head_sha=head_sha)
+    if existing_id and existing_body:
+        marker = COMMIT_ID_TAG + head_sha + COMMIT_ID_END_TAG
+        body, replaced = _TAG_PATTERNS['commit'].subn(lambda _: marker, existing_body, count=1)
+        if not replaced:
+            body = existing_body.rstrip("\n") + "\n\n" + marker + "\n"
+        if body == existing_body:
+            sys.exit(0) # Head SHA already recorded
+    if existing_id:
+        github_api.update_comment(existing_id, body)
+    else:
+        github_api.post_pr_comment(pr_number, body)
+    sys.exit(0)
 
 def main():
-    print("Starting AI Review Bot (Incremental Mode)...")
+    log.info("Starting AI Review Bot (Incremental Mode)...")
 
     # 1. Get event payload path
     event_path = os.getenv("GITHUB_EVENT_PATH")
     if not event_path or not os.path.exists(event_path):
-        print(f"Error: GITHUB_EVENT_PATH '{event_path}' is invalid or file does not exist.", file=sys.stderr)
+        log.error("GITHUB_EVENT_PATH '%s' is invalid or file does not exist.", event_path)
         sys.exit(1)
 
     # 2. Parse event payload (still expecting issue_comment for trigger)
     try:
-        with open(event_path, 'r') as f:
-            event_payload = json.load(f)
+        with open(event_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Most comment events aren't triggers; skip parsing the payload unless the command appears in it
+            if all(mm.find(needle) == -1 for needle in _TRIGGER_NEEDLES):
+                log.info("Event payload does not contain trigger command '%s'. Skipping.", TRIGGER_COMMAND)
+                sys.exit(0)
+            event_payload = _json_loads(mm[:])
         comment_body = event_payload["comment"]["body"]
         if "pull_request" not in event_payload["issue"]:
-             print("Comment is not on a Pull Request. Skipping.")
+             log.info("Comment is not on a Pull Request. Skipping.")
              sys.exit(0)
         pr_number = event_payload["issue"]["number"]
-    except (KeyError, json.JSONDecodeError, Exception) as e:
-        print(f"Error parsing event payload or extracting required fields: {e}", file=sys.stderr)
+    except (KeyError, ValueError, Exception) as e: # ValueError covers both json and orjson decode errors
+        log.error("Error parsing event payload or extracting required fields: %s", e)
         # print("Payload dump:", json.dumps(event_payload, indent=2)) # Uncomment for debugging
         sys.exit(1)
 
-    print(f"Processing comment on PR #{pr_number}...")
+    log.info("Processing comment on PR #%s...", pr_number)
 
     # 3. Check trigger command
     if not comment_body.strip().startswith(TRIGGER_COMMAND):
-        print(f"Comment does not start with trigger command '{TRIGGER_COMMAND}'. Skipping.")
+        log.info("Comment does not start with trigger command '%s'. Skipping.", TRIGGER_COMMAND)
         sys.exit(0)
 
-    print("Trigger command detected.")
+    log.info("Trigger command detected.")
 
     # 4. Instantiate GitHubAPI & Load Config
     try:
         github_api = GitHubAPI()
         config = load_config()
-        print(f"\n--- Loaded Configuration ---")
-        print(f"Exclude patterns: {config.get('exclude')}")
-        print(f"Custom instructions: {config.get('custom_instructions', '')[:100]}...")
-        print("--------------------------")
+        log.info("\n--- Loaded Configuration ---")
+        log.info("Exclude patterns: %s", config.get('exclude'))
+        log.info("Custom instructions: %s...", config.get('custom_instructions', '')[:100])
+        log.info("--------------------------")
     except (ValueError, Exception) as e: # Catch API init errors or config load errors
-        print(f"Error during initialization or config loading: {e}", file=sys.stderr)
+        log.error("Error during initialization or config loading: %s", e)
         sys.exit(1)
 
-    # 5. Fetch PR Metadata
-    print(f"\n--- Fetching PR Metadata for #{pr_number} ---")
-    pr_metadata = github_api.get_pr_metadata(pr_number)
+    # 5. Fetch PR Metadata (and recent comments) in one GraphQL round-trip, falling back to REST
+    log.info("\n--- Fetching PR Metadata for #%s ---", pr_number)
+    pr_bundle = github_api.get_pr_bundle(pr_number)
+    if pr_bundle:
+        pr_metadata = {key: pr_bundle[key] for key in ("title", "description", "base_sha", "head_sha")}
+    else:
+        log.info("Falling back to REST for PR metadata.")
+        pr_metadata = github_api.get_pr_metadata(pr_number)
     if not pr_metadata or not pr_metadata.get('base_sha') or not pr_metadata.get('head_sha'):
-        print("Error: Could not fetch essential PR metadata (base/head SHAs).", file=sys.stderr)
+        log.error("Could not fetch essential PR metadata (base/head SHAs).")
         sys.exit(1)
     
     current_head_sha = pr_metadata['head_sha']
     pr_base_sha = pr_metadata['base_sha']
-    print(f"Title: {pr_metadata['title']}")
-    print(f"Base SHA: {pr_base_sha}")
-    print(f"Head SHA: {current_head_sha}")
-    print("------------------------------------")
+    log.info("Title: %s", pr_metadata['title'])
+    log.info("Base SHA: %s", pr_base_sha)
+    log.info("Head SHA: %s", current_head_sha)
+    log.info("------------------------------------")
 
     # 6. Find Existing Summary Comment and Last Reviewed Commit
-    print("\n--- Checking for Existing Review Summary ---")
+    log.info("\n--- Checking for Existing Review Summary ---")
     last_reviewed_commit_sha = None
-    existing_summarize_cmt = github_api.find_comment_with_tag(pr_number, SUMMARY_COMMENT_TAG)
+    existing_summarize_cmt = None
+    # The bundle only carries the most recent comments; otherwise scan them all via REST
+    bundle_has_all_comments = bool(pr_bundle) and pr_bundle['comments_total'] <= len(pr_bundle['comments'])
+    if pr_bundle:
+        existing_summarize_cmt = next((c for c in pr_bundle['comments'] if SUMMARY_COMMENT_TAG in (c['body'] or "")), None)
+        if existing_summarize_cmt and not existing_summarize_cmt['id']:
+            # No REST comment ID reported for it; fetch the comment itself via REST
+            existing_summarize_cmt, bundle_has_all_comments = None, False
+    if not existing_summarize_cmt and not bundle_has_all_comments:
+        existing_summarize_cmt = github_api.find_comment_with_tag(pr_number, SUMMARY_COMMENT_TAG)
     existing_summarize_cmt_body = ""
     existing_summarize_cmt_id = None
+    existing_sections = parse_summary_sections("")
 
     if existing_summarize_cmt:
         existing_summarize_cmt_id = existing_summarize_cmt['id']
         existing_summarize_cmt_body = existing_summarize_cmt.get('body', '')
-        print(f"Found existing summary comment ID: {existing_summarize_cmt_id}")
+        log.info("Found existing summary comment ID: %s", existing_summarize_cmt_id)
         # Extract last reviewed commit
-        last_reviewed_commit_sha = extract_from_tag(existing_summarize_cmt_body, COMMIT_ID_TAG, COMMIT_ID_END_TAG)
+        existing_sections = parse_summary_sections(existing_summarize_cmt_body)
+        last_reviewed_commit_sha = existing_sections['commit'] or None
         if last_reviewed_commit_sha:
-            print(f"Last reviewed commit found: {last_reviewed_commit_sha}")
+            log.info("Last reviewed commit found: %s", last_reviewed_commit_sha)
         else:
-            print("No last reviewed commit SHA found in existing comment.")
+            log.info("No last reviewed commit SHA found in existing comment.")
     else:
-        print("No existing summary comment found.")
-    print("------------------------------------------")
+        log.info("No existing summary comment found.")
+    log.info("------------------------------------------")
 
     # 7. Determine Diff Range and Compare Commits
     base_for_diff = last_reviewed_commit_sha or pr_base_sha
-    print(f"\n--- Comparing Commits: {base_for_diff[:7]}...{current_head_sha[:7]} ---")
+    log.info("\n--- Comparing Commits: %s...%s ---", base_for_diff[:7], current_head_sha[:7])
 
     if base_for_diff == current_head_sha:
-        print("Skipped: Head commit is the same as the base for diff. No new changes to review.")
+        log.info("Skipped: Head commit is the same as the base for diff. No new changes to review.")
         # Optionally update the comment timestamp or add a "checked" message
         sys.exit(0)
 
     comparison_data = github_api.compare_commits(base_for_diff, current_head_sha)
 
     if not comparison_data:
-        print("Error: Failed to compare commits.", file=sys.stderr)
+        log.error("Failed to compare commits.")
         sys.exit(1)
 
     if comparison_data.get('status') == 'identical':
-        print("Skipped: No difference between commits.")
+        log.info("Skipped: No difference between commits.")
         # Update summary comment to reflect the new head SHA was checked
-        final_summary_comment_body = f"{SUMMARY_COMMENT_TAG}\nNo changes detected since last review.\n{COMMIT_ID_TAG}{current_head_sha}{COMMIT_ID_END_TAG}"
-        if existing_summarize_cmt_id:
-            github_api.update_comment(existing_summarize_cmt_id, final_summary_comment_body)
-        else:
-            github_api.post_pr_comment(pr_number, final_summary_comment_body)
-        sys.exit(0)
+        _finalize_no_change(github_api, pr_number, existing_summarize_cmt_id, current_head_sha,
+                            "No changes detected since last review.")
 
     if comparison_data.get('status') == 'behind':
-        print("Warning: Head commit is behind the base for diff. This might indicate a force push or unusual history. Reviewing changes anyway.")
+        log.warning("Head commit is behind the base for diff. This might indicate a force push or unusual history. Reviewing changes anyway.")
         # Potentially add logic to reset last_reviewed_commit_sha?
 
     comparison_files = comparison_data.get('files', [])
-    comparison_commits = comparison_data.get('commits', []) # List of commit objects in the range
+    total_files_count = len(comparison_files)
+    # Only the count of commits is used; 'total_commits' is exact even when 'commits' is truncated
+    total_commits_count = comparison_data.get('total_commits', len(comparison_data.get('commits', [])))
 
     if not comparison_files:
-        print("Skipped: No file changes found in the comparison.")
+        log.info("Skipped: No file changes found in the comparison.")
         # Update summary comment to reflect the new head SHA was checked
-        final_summary_comment_body = f"{SUMMARY_COMMENT_TAG}\nNo file changes detected since last review.\n{COMMIT_ID_TAG}{current_head_sha}{COMMIT_ID_END_TAG}"
-        if existing_summarize_cmt_id:
-            github_api.update_comment(existing_summarize_cmt_id, final_summary_comment_body)
-        else:
-            github_api.post_pr_comment(pr_number, final_summary_comment_body)
-        sys.exit(0)
+        _finalize_no_change(github_api, pr_number, existing_summarize_cmt_id, current_head_sha,
+                            "No file changes detected since last review.")
 
-    print(f"Found {len(comparison_files)} files changed in comparison.")
-    print(f"Found {len(comparison_commits)} commits in comparison.")
-    print("---------------------------------------------------")
+    log.info("Found %s files changed in comparison.", total_files_count)
+    log.info("Found %s commits in comparison.", total_commits_count)
+    log.info("---------------------------------------------------")
 
     # 8. Filter Files
-    print("\n--- Filtering Files ---")
+    log.info("\n--- Filtering Files ---")
     filtered_files_to_process = []
-    file_patches_map = {} # Store patch info {filename: [patch_info1, patch_info2,...]}
+    file_patch_bounds = {} # {filename: (sorted hunk starts, ends)} for find_best_patch_line
     excluded_files_count = 0
+    is_excluded = compile_exclude(config['exclude']) # Build the matcher once, not per file
     for file_data in comparison_files:
         # The comparison endpoint includes 'filename', 'status' (added, modified, removed), 'patch', etc.
         file_path = file_data.get('filename')
         if not file_path:
-             print("Warning: Skipping file data with missing filename.")
+             log.warning("Skipping file data with missing filename.")
              continue
-             
-        if file_data.get('status') == 'removed':
-             print(f"Skipping removed file: {file_path}")
+        status = file_data.get('status', 'modified')
+        patch = file_data.get('patch')
+
+        if status == 'removed':
+             log.info("Skipping removed file: %s", file_path)
              continue # Can't review removed files
 
-        if should_exclude_file(file_path, config['exclude']):
-            print(f"Excluding file: {file_path}")
+        if is_excluded and is_excluded(file_path):
+            log.info("Excluding file: %s", file_path)
             excluded_files_count += 1
-        elif not file_data.get('patch'):
-            print(f"Skipping file with no patch data: {file_path}") # Should not happen for added/modified
+        elif not patch:
+            log.info("Skipping file with no patch data: %s", file_path) # Should not happen for added/modified
         else:
             # TODO: Parse hunks here using updated utils to get patch line info
             # Example structure for patch_info: {'header': str, 'content': str, 'new_start_line': int, 'new_end_line': int}
-            parsed_hunks = parse_hunks_from_patch(file_data['patch']) 
+            parsed_hunks = parse_hunks_cached(patch)
             if not parsed_hunks:
-                 print(f"  Warning: Could not parse hunks for {file_path}. Skipping review for this file.")
+                 log.warning("  Could not parse hunks for %s. Skipping review for this file.", file_path)
                  continue # Skip if parsing fails
 
-            file_patches_map[file_path] = parsed_hunks
-            file_data['parsed_hunks'] = parsed_hunks # Attach parsed hunks for later use
-            filtered_files_to_process.append(file_data)
+            # Sorted hunk bounds so remapping a review comment is a binary search.
+            # Per-hunk line maps are built in step 11, only for hunks that actually get comments.
+            file_patch_bounds[file_path] = build_patch_bounds(parsed_hunks)
+            # Keep only the fields later steps use, not the whole compare entry (URLs, blob SHA, stats...)
+            filtered_files_to_process.append({
+                'filename': file_path,
+                'status': status,
+                'patch': patch, # Dropped once summary prompts are built (step 10a)
+                'parsed_hunks': parsed_hunks,
+            })
 
 
-    print(f"Total files in comparison: {len(comparison_files)}")
-    print(f"Files excluded: {excluded_files_count}")
-    print(f"Files to review/summarize: {len(filtered_files_to_process)}")
-    print("-----------------------")
+    # Release the comparison payload (commit objects, removed/excluded file patches) before the long
+    # summarization and review phases; only the filtered file dicts are still referenced.
+    del comparison_data, comparison_files
+
+    log.info("Total files in comparison: %s", total_files_count)
+    log.info("Files excluded: %s", excluded_files_count)
+    log.info("Files to review/summarize: %s", len(filtered_files_to_process))
+    log.info("-----------------------")
 
     if not filtered_files_to_process:
-        print("No files left to review after filtering. Exiting.")
-        # Update summary comment? (Maybe add status that files were excluded)
-        # Consider creating/updating the comment here similar to the no-change cases above.
-        sys.exit(0)
+        log.info("No files left to review after filtering. Exiting.")
+        _finalize_no_change(github_api, pr_number, existing_summarize_cmt_id, current_head_sha,
+                            f"No reviewable file changes since last review ({excluded_files_count} excluded by config).",
+                            existing_body=existing_summarize_cmt_body)
+
+    # Fetch review context for every file in parallel now, so it overlaps with summarization.
+    # Use the PR base for context, or the head if the file is newly added in this PR.
+    content_refs = {
+        fd['filename']: pr_base_sha if fd['status'] != 'added' else current_head_sha
+        for fd in filtered_files_to_process
+    }
+    # One batched Git Trees + blobs fetch per ref (at most two: base and head)
+    paths_by_ref = {}
+    for file_path, content_ref in content_refs.items():
+        paths_by_ref.setdefault(content_ref, []).append(file_path)
+    log.info("Prefetching content for %s files...", len(content_refs))
+    content_fetch_executor = ThreadPoolExecutor(max_workers=len(paths_by_ref))
+    content_futures = {
+        content_ref: content_fetch_executor.submit(github_api.get_blobs_for_paths, paths, content_ref)
+        for content_ref, paths in paths_by_ref.items()
+    }
+    content_fetch_executor.shutdown(wait=False) # Queued fetches still run; results are awaited in step 11
 
     # 9. Initialize Gemini Client
     try:
         gemini = GeminiClient()
     except ValueError as e:
-        print(f"Error initializing Gemini Client: {e}", file=sys.stderr)
+        log.error("Error initializing Gemini Client: %s", e)
         sys.exit(1)
 
     # 10. Summarization Phase
-    print("\n--- Summarization Phase ---")
+    log.info("\n--- Summarization Phase ---")
     # Initialize summaries from existing comment if available
-    raw_summary = extract_from_tag(existing_summarize_cmt_body, RAW_SUMMARY_START_TAG, RAW_SUMMARY_END_TAG) or ""
-    short_summary = extract_from_tag(existing_summarize_cmt_body, SHORT_SUMMARY_START_TAG, SHORT_SUMMARY_END_TAG) or ""
+    raw_summary = existing_sections['raw']
+    short_summary = existing_sections['short']
     # Final summary is always regenerated
     final_summary = "" 
     summaries_failed = []
     individual_summaries = [] # Store successful individual file summaries
 
-    # a. Summarize individual file diffs
-    print("  Generating individual file summaries...")
+    # a. Summarize individual file diffs (all eligible files are sent to Gemini concurrently)
+    log.info("  Generating individual file summaries...")
+    pending_summaries = [] # (filename, file_diff, prompt) for files with diff content
     for file_data in filtered_files_to_process:
         filename = file_data['filename']
         file_diff = file_data['patch']
@@ -312,66 +509,88 @@ def main():
              summaries_failed.append(f"{filename} (No diff content)")
              continue
 
-        # TODO: Check token count for file_diff before sending?
-        if len(file_diff) > MAX_CHARS_FILE_SUMMARY_DIFF:
-            print(f"  Skipping summary for {filename}: Diff too long ({len(file_diff)} > {MAX_CHARS_FILE_SUMMARY_DIFF} chars).")
-            summaries_failed.append(f"{filename} (Diff too long)")
-            continue
+        # Diff length is checked in the summary task (counting tokens is an API call)
+        pending_summaries.append((filename, file_diff, SUMMARIZE_FILE_DIFF_PROMPT.format(filename=filename, file_diff=file_diff)))
 
-        prompt = SUMMARIZE_FILE_DIFF_PROMPT.format(filename=filename, file_diff=file_diff)
-        try:
-            # Assuming get_review returns the raw text response for non-JSON prompts
-            # Need to adjust gemini_client if it strictly expects/parses JSON
-            file_summary_text = gemini.generate_text(prompt)
-            if file_summary_text:
-                 # Prepend filename for clarity when combining later
-                 individual_summaries.append(f"**{filename}:**\\n{file_summary_text}")
-            else:
-                 summaries_failed.append(f"{filename} (Empty summary response)")
-        except Exception as e:
-             print(f"  Error summarizing {filename}: {e}", file=sys.stderr)
-             summaries_failed.append(f"{filename} (API Error: {e})")
+    # The review phase works from parsed_hunks only; release the raw patch text
+    for file_data in filtered_files_to_process:
+        del file_data['patch']
+
+    summary_results = asyncio.run(_gather_summaries(gemini, [(file_diff, prompt) for _, file_diff, prompt in pending_summaries]))
+    for (filename, file_diff, _), result in zip(pending_summaries, summary_results):
+        if isinstance(result, Exception):
+             log.error("  Error summarizing %s: %s", filename, result)
+             summaries_failed.append(f"{filename} (API Error: {result})")
+             continue
+        problem, file_summary_text = result
+        if problem:
+            log.info("  Skipping summary for %s: Diff too long (%s chars, %s).", filename, len(file_diff), problem)
+            summaries_failed.append(f"{filename} (Diff {problem})")
+        elif file_summary_text:
+             # Prepend filename for clarity when combining later
+             individual_summaries.append(f"**{filename}:**\\n{file_summary_text}")
+        else:
+             summaries_failed.append(f"{filename} (Empty summary response)")
 
-    print(f"  Generated {len(individual_summaries)} individual summaries.")
+    del pending_summaries, summary_results # The prompts embed each file's patch
+    log.info("  Generated %s individual summaries.", len(individual_summaries))
 
     # b. Combine individual summaries into raw_summary (if any were generated)
+    fused_summaries = None
     if individual_summaries:
         combined_individual = "\n\n---\n\n".join(individual_summaries)
-        # Prepend to any existing raw summary from previous runs
-        raw_summary = f"{combined_individual}\n\n---\nPrevious Summary:\n{raw_summary}" if raw_summary else combined_individual
+        # Append to the raw summaries from previous runs (newest last), dropping all but the most recent ones
+        summary_history = deque(maxlen=MAX_SUMMARY_HISTORY)
+        if raw_summary:
+            summary_history.extend(raw_summary.split(SUMMARY_HISTORY_SEPARATOR))
+        summary_history.append(combined_individual)
+        raw_summary = SUMMARY_HISTORY_SEPARATOR.join(summary_history)
 
-        # c. Refine raw_summary (using SUMMARIZE_CHANGESETS_PROMPT)
-        print("  Refining raw summary...")
-        # TODO: Check token count for raw_summary?
         summary_input = raw_summary
-        if len(raw_summary) > MAX_CHARS_RAW_SUMMARY_INPUT:
-            print(f"  Warning: Raw summary input too long ({len(raw_summary)} chars). Truncating for refinement prompt.")
-            summary_input = raw_summary[:MAX_CHARS_RAW_SUMMARY_INPUT] + "\n... (Content truncated)"
+        problem = check_token_budget(gemini, raw_summary, MAX_CHARS_RAW_SUMMARY_INPUT, MAX_TOKENS_RAW_SUMMARY_INPUT)
+        if problem:
+            log.warning("  Raw summary input too long (%s chars, %s). Truncating for summary prompts.", len(raw_summary), problem)
+            summary_input = tail_trim(raw_summary, MAX_CHARS_RAW_SUMMARY_INPUT)
+
+        # c. Refined, final and short summaries in one call (falls back to one prompt each below)
+        log.info("  Generating refined, final and short summaries...")
+        fused_summaries = summarize_all(gemini, summary_input)
+        if fused_summaries:
+            raw_summary = fused_summaries['refined']
+            final_summary = fused_summaries['final']
+            short_summary = fused_summaries['short']
+        else:
+            log.warning("  Combined summary response was unusable. Falling back to separate summary prompts.")
 
-        prompt_refine = SUMMARIZE_CHANGESETS_PROMPT.format(raw_summary=raw_summary)
+    if individual_summaries and not fused_summaries:
+        # Refine raw_summary (using SUMMARIZE_CHANGESETS_PROMPT)
+        log.info("  Refining raw summary...")
+        prompt_refine = SUMMARIZE_CHANGESETS_PROMPT.format(raw_summary=summary_input)
         try:
             refined_summary = gemini.generate_text(prompt_refine)
             if refined_summary:
                 raw_summary = refined_summary # Update raw_summary with the refined version
             else:
-                print("  Warning: Got empty response when refining raw summary.")
+                log.warning("  Got empty response when refining raw summary.")
                 # Keep the combined individual summaries as raw_summary
         except Exception as e:
-            print(f"  Error refining raw summary: {e}", file=sys.stderr)
+            log.error("  Error refining raw summary: %s", e)
             summaries_failed.append("Overall Raw Summary (Refinement API Error)")
             # Keep the combined individual summaries as raw_summary in case of error
-    else:
-        print("  Skipping raw summary refinement as no individual summaries were generated.")
+    elif not individual_summaries:
+        log.info("  Skipping raw summary refinement as no individual summaries were generated.")
 
     # d. Generate Final Summary (using SUMMARIZE_FINAL_PROMPT)
-    if raw_summary:
-        print("  Generating final summary...")
+    if fused_summaries:
+        pass # Already generated in step c
+    elif raw_summary:
+        log.info("  Generating final summary...")
         summary_input = raw_summary
-        if len(raw_summary) > MAX_CHARS_RAW_SUMMARY_INPUT:
-            print(f"  Warning: Raw summary input too long ({len(raw_summary)} chars). Truncating for final summary prompt.")
-            summary_input = raw_summary[:MAX_CHARS_RAW_SUMMARY_INPUT] + "\n... (Content truncated)"
-
-        prompt_final = SUMMARIZE_FINAL_PROMPT.format(raw_summary=raw_summary)
+        problem = check_token_budget(gemini, raw_summary, MAX_CHARS_RAW_SUMMARY_INPUT, MAX_TOKENS_RAW_SUMMARY_INPUT)
+        if problem:
+            log.warning("  Raw summary input too long (%s chars, %s). Truncating for final summary prompt.", len(raw_summary), problem)
+            summary_input = tail_trim(raw_summary, MAX_CHARS_RAW_SUMMARY_INPUT)
+        prompt_final = SUMMARIZE_FINAL_PROMPT.format(raw_summary=summary_input)
         try:
             final_summary_text = gemini.generate_text(prompt_final)
             if final_summary_text:
@@ -380,20 +599,16 @@ def main():
                 summaries_failed.append("Overall Final Summary (Empty Response)")
                 final_summary = "*Could not generate final summary.*" # Set fallback
         except Exception as e:
-            print(f"  Error generating final summary: {e}", file=sys.stderr)
+            log.error("  Error generating final summary: %s", e)
             summaries_failed.append(f"Overall Final Summary (API Error: {e})")
             final_summary = f"*Error generating final summary: {e}*" # Set fallback
     else:
          final_summary = "*No changes detected or summarizable in this update.*"
 
     # e. Generate Short Summary (using SUMMARIZE_SHORT_PROMPT)
-    if raw_summary:
-        print("  Generating short summary...")
-        summary_input = raw_summary
-        if len(raw_summary) > MAX_CHARS_RAW_SUMMARY_INPUT:
-            # No need to truncate for short summary, it should handle long input
-            pass 
-
+    if raw_summary and not fused_summaries:
+        log.info("  Generating short summary...")
+        # No need to truncate for short summary, it should handle long input
         prompt_short = SUMMARIZE_SHORT_PROMPT.format(raw_summary=raw_summary)
         try:
             short_summary_text = gemini.generate_text(prompt_short)
@@ -402,57 +617,57 @@ def main():
             else:
                 summaries_failed.append("Overall Short Summary (Empty Response)")
                 # Keep existing short_summary or clear it?
-                short_summary = extract_from_tag(existing_summarize_cmt_body, SHORT_SUMMARY_START_TAG, SHORT_SUMMARY_END_TAG) or ""
+                short_summary = existing_sections['short']
         except Exception as e:
-            print(f"  Error generating short summary: {e}", file=sys.stderr)
+            log.error("  Error generating short summary: %s", e)
             summaries_failed.append(f"Overall Short Summary (API Error: {e})")
-            short_summary = extract_from_tag(existing_summarize_cmt_body, SHORT_SUMMARY_START_TAG, SHORT_SUMMARY_END_TAG) or "" # Keep existing on error
+            short_summary = existing_sections['short'] # Keep existing on error
 
 
-    print("Summarization phase complete.")
-    print("-------------------------")
+    log.info("Summarization phase complete.")
+    log.info("-------------------------")
 
 
     # 11. Review Phase
-    print("\n--- Detailed Review Phase ---")
+    log.info("\n--- Detailed Review Phase ---")
     all_review_comments = [] # List of dicts for create_review: {"path": ..., "line": ..., "body": ...}
     reviews_failed = []
     total_hunks_processed = 0
 
-    # Process file by file from the filtered comparison list
+    # a. Build all hunk prompts up front (context extraction is local CPU work),
+    #    so the Gemini calls below only do network I/O and can run concurrently.
+    review_jobs = [] # (file_path, hunk_index, hunk_info, prompt)
     for file_data in filtered_files_to_process:
         file_path = file_data['filename']
-        patch_content = file_data['patch']
-        status = file_data.get('status', 'modified') # e.g., 'added', 'modified'
+        status = file_data['status'] # e.g., 'added', 'modified'
         hunks = file_data['parsed_hunks'] # Use pre-parsed hunks
-        print(f"\nReviewing file: {file_path} (Status: {status})")
+        log.info("\nPreparing review for file: %s (Status: %s)", file_path, status)
 
-        # Get full file content *at the PR base* for context extraction
-        # Use head_sha if file is newly added in this PR.
-        content_ref = pr_base_sha if status != 'added' else current_head_sha
-        full_file_content = get_cached_file_content(github_api, file_path, content_ref)
+        # Full file content *at the PR base* (prefetched after step 8) for context extraction
+        content_ref = content_refs[file_path]
+        full_file_content = content_futures[content_ref].result().get(file_path)
 
         if full_file_content is None:
-             print(f"  Error fetching base content ({content_ref[:7]}) for {file_path}, skipping reviews for this file.", file=sys.stderr)
+             log.error("  Error fetching base content (%s) for %s, skipping reviews for this file.", content_ref[:7], file_path)
              reviews_failed.append(f"{file_path} (Content fetch failed)")
              continue # Skip to next file
         elif full_file_content == "" and status != 'added':
-             print(f"  Warning: Base content for {file_path} at {content_ref[:7]} is empty (might be deleted/renamed?). Skipping reviews for this file.")
+             log.warning("  Base content for %s at %s is empty (might be deleted/renamed?). Skipping reviews for this file.", file_path, content_ref[:7])
              continue
 
         # Process hunks within the file
         for hunk_index, hunk_info in enumerate(hunks):
             total_hunks_processed += 1
-            print(f"  Processing hunk {hunk_index + 1}/{len(hunks)} for {file_path}")
+            log.debug("  Processing hunk %d/%d for %s", hunk_index + 1, len(hunks), file_path) # Per-hunk; lazy args
 
-            # a. Extract Context
+            # Extract Context
             # TODO: Review/Update extract_context_around_hunk for direct patch/header usage
             code_context_snippet = extract_context_around_hunk(full_file_content, hunk_info['header'])
 
-            # b. Fetch Jira context (Placeholder)
+            # Fetch Jira context (Placeholder)
             jira_context = "N/A" # TODO: Implement Jira fetching
 
-            # c. Build prompt
+            # Build prompt
             prompt = build_review_prompt(
                 pr_details=pr_metadata, # Use fetched metadata
                 file_path=file_path,
@@ -462,50 +677,59 @@ def main():
                 jira_context=jira_context
             )
 
-            # Check prompt length before sending
-            if len(prompt) > MAX_CHARS_REVIEW_PROMPT:
-                print(f"  Skipping review for hunk {hunk_index + 1} in {file_path}: Prompt too long ({len(prompt)} > {MAX_CHARS_REVIEW_PROMPT} chars).")
-                # Potentially try reducing context first?
-                reviews_failed.append(f"{file_path} Hunk {hunk_index + 1} (Prompt too long)")
-                continue # Skip this hunk
+            # Prompt length is checked in the review worker (counting tokens is an API call)
+            review_jobs.append((file_path, hunk_index, hunk_info, prompt))
 
-            # d. Call Gemini API
+    # b. Call Gemini API for all hunks concurrently
+    log.info("\nSending %s hunks to Gemini for review...", len(review_jobs))
+    with ThreadPoolExecutor(max_workers=MAX_REVIEW_WORKERS) as executor:
+        futures = [executor.submit(review_within_budget, gemini, prompt) for _, _, _, prompt in review_jobs]
+
+        # c. Collect responses (in submission order, so comments are posted deterministically)
+        for (file_path, hunk_index, hunk_info, prompt), future in zip(review_jobs, futures):
             try:
-                review_result = gemini.get_review(prompt)
+                problem, review_result = future.result()
             except Exception as e:
-                print(f"  Error calling Gemini API for hunk {hunk_index + 1} in {file_path}: {e}", file=sys.stderr)
+                log.error("  Error calling Gemini API for hunk %s in %s: %s", hunk_index + 1, file_path, e)
                 reviews_failed.append(f"{file_path} Hunk {hunk_index + 1} (API Error: {e})")
                 continue # Skip this hunk
 
-            # e. Collect responses
-            if review_result and 'reviews' in review_result:
+            if problem:
+                log.info("  Skipping review for hunk %s in %s: Prompt too long (%s chars, %s).", hunk_index + 1, file_path, len(prompt), problem)
+                # Potentially try reducing context first?
+                reviews_failed.append(f"{file_path} Hunk {hunk_index + 1} (Prompt {problem})")
+                continue # Skip this hunk
+
+            if review_result and review_result.get('reviews'):
+                line_map = hunk_info.get('line_map')
+                if line_map is None: # Built once per commented hunk; most hunks get no comments
+                    line_map = hunk_info['line_map'] = build_hunk_line_map(hunk_info)
+                patch_bounds = file_patch_bounds[file_path]
                 for review in review_result['reviews']:
                     hunk_line_num_relative = review.get('lineNumber') # Line num relative to hunk start
                     review_comment_body = review.get('reviewComment')
 
                     if hunk_line_num_relative is None or not review_comment_body:
-                        print(f"  Warning: Skipping review item with missing 'lineNumber' or empty 'reviewComment' in {file_path}")
+                        log.warning("  Skipping review item with missing 'lineNumber' or empty 'reviewComment' in %s", file_path)
                         continue
 
                     # Map hunk-relative line to absolute file line
-                    # TODO: Ensure map_review_to_file_line uses hunk_info correctly
-                    target_file_line = map_review_to_file_line(hunk_line_num_relative, hunk_info)
+                    target_file_line = line_map.get(hunk_line_num_relative) # None for deleted/out-of-range lines
 
                     if target_file_line is None:
-                         print(f"  Warning: Could not map hunk line {hunk_line_num_relative} to file line for {file_path} (hunk {hunk_index + 1}). Comment may be lost.")
+                         log.warning("  Could not map hunk line %s to file line for %s (hunk %s). Comment may be lost.", hunk_line_num_relative, file_path, hunk_index + 1)
                          reviews_failed.append(f"{file_path} Hunk {hunk_index + 1} (Line mapping failed)")
                          continue
 
                     # Find the best patch hunk boundary to attach the comment to (like example code)
-                    # TODO: Ensure find_best_patch_for_line works with file_patches_map[file_path]
-                    final_line, remapped = find_best_patch_for_line(target_file_line, file_patches_map[file_path])
+                    final_line, remapped = find_best_patch_line(target_file_line, patch_bounds)
 
                     comment_to_post = review_comment_body
                     if remapped:
-                        print(f"    Remapped comment for original target line {target_file_line} to patch line {final_line}")
+                        log.info("    Remapped comment for original target line %s to patch line %s", target_file_line, final_line)
                         comment_to_post = f"> Note: This review targeted line {target_file_line}, which is outside the changed code blocks. It has been attached to the nearest change block (line {final_line}).\n\n{review_comment_body}"
 
-                    print(f"    Adding review comment for {file_path}:{final_line}")
+                    log.info("    Adding review comment for %s:%s", file_path, final_line)
                     all_review_comments.append({
                         "path": file_path,
                         "line": final_line,
@@ -516,89 +740,77 @@ def main():
                  reviews_failed.append(f"{file_path} Hunk {hunk_index + 1} (Invalid/Empty API Response)")
 
 
-    print(f"--- Review Phase Complete ---")
-    print(f"Total Hunks Processed: {total_hunks_processed}")
-    print(f"Total Review Comments Generated: {len(all_review_comments)}")
+    log.info("--- Review Phase Complete ---")
+    log.info("Total Hunks Processed: %s", total_hunks_processed)
+    log.info("Total Review Comments Generated: %s", len(all_review_comments))
     if reviews_failed:
-        print(f"Review Errors Encountered ({len(reviews_failed)}):")
+        log.info("Review Errors Encountered (%s):", len(reviews_failed))
         for fail in reviews_failed:
-            print(f"  - {fail}")
-    print("--------------------------")
+            log.info("  - %s", fail)
+    log.info("--------------------------")
 
 
     # 12. Construct Final Summary Comment & Post Outputs
-    print("\n--- Finalizing Output ---")
+    log.info("\n--- Finalizing Output ---")
 
     # Build status message section
     status_lines = []
     status_lines.append(f"Compared `{base_for_diff[:7]}`...`{current_head_sha[:7]}`.")
-    status_lines.append(f"Processed {len(filtered_files_to_process)} out of {len(comparison_files)} changed files ({excluded_files_count} excluded).")
+    status_lines.append(f"Processed {len(filtered_files_to_process)} out of {total_files_count} changed files ({excluded_files_count} excluded).")
     status_lines.append(f"Generated {len(all_review_comments)} review comments.")
     # TODO: Add counts for skipped/failed summaries/reviews based on implemented logic
 
     status_details = "\n".join(status_lines)
     if summaries_failed:
          failed_summaries_str = "* " + "\n* ".join(summaries_failed)
-         status_details += f"\\n<details><summary>Summarization Errors ({len(summaries_failed)})</summary>\\n\\n{failed_summaries_str}\\n\\n</details>"
+         status_details += f"\n<details><summary>Summarization Errors ({len(summaries_failed)})</summary>\n\n{failed_summaries_str}\n\n</details>"
     if reviews_failed:
          failed_reviews_str = "* " + "\n* ".join(reviews_failed)
-         status_details += f"\\n<details><summary>Review Errors ({len(reviews_failed)})</summary>\\n\\n{failed_reviews_str}\\n\\n</details>"
+         status_details += f"\n<details><summary>Review Errors ({len(reviews_failed)})</summary>\n\n{failed_reviews_str}\n\n</details>"
 
     # Construct the full comment body
     # Use the generated/updated summaries from step 10
     # Note: raw_summary might have been refined in step 10c
-
-    summary_comment_body = f"""{SUMMARY_COMMENT_TAG}
- **Gemini Code Review Summary**
- 
- {final_summary}
- 
- {RAW_SUMMARY_START_TAG}
- {raw_summary} 
- {RAW_SUMMARY_END_TAG}
- 
- {SHORT_SUMMARY_START_TAG}
- {short_summary}
- {SHORT_SUMMARY_END_TAG}
- 
- ---
-<details><summary>Review Status</summary>
-
-{status_details}
-
-</details>
-
-{COMMIT_ID_TAG}{current_head_sha}{COMMIT_ID_END_TAG}
-"""
+    # (assembled from parts and joined once; the summaries can each be several KB)
+    summary_comment_body = "".join([
+        SUMMARY_COMMENT_TAG, "\n**Gemini Code Review Summary**\n\n",
+        final_summary, "\n\n",
+        RAW_SUMMARY_START_TAG, "\n", raw_summary, "\n", RAW_SUMMARY_END_TAG, "\n\n",
+        SHORT_SUMMARY_START_TAG, short_summary, SHORT_SUMMARY_END_TAG, "\n\n",
+        "---\n<details><summary>Review Status</summary>\n\n",
+        status_details,
+        "\n\n</details>\n\n",
+        COMMIT_ID_TAG, current_head_sha, COMMIT_ID_END_TAG, "\n",
+    ])
     # Post the line comments as a review
     # Only add the summary comment body to the review if we are *not* updating an existing comment
     review_body = "" if existing_summarize_cmt_id else summary_comment_body
     if all_review_comments:
-        print(f"Posting {len(all_review_comments)} review comments...")
+        log.info("Posting %s review comments...", len(all_review_comments))
         # Create review uses the *latest* head commit SHA
         github_api.create_review(pr_number, current_head_sha, all_review_comments, body=review_body)
     elif review_body:
-        print("No line comments generated, but posting summary as review body...")
+        log.info("No line comments generated, but posting summary as review body...")
         # Post empty review just to get the summary body onto the PR if no comments were made
         # and we are creating the summary comment for the first time.
         github_api.create_review(pr_number, current_head_sha, [], body=review_body)
     else:
-        print("No review comments generated.")
+        log.info("No review comments generated.")
 
     # Create or Update the Summary Comment
     if existing_summarize_cmt_id:
-        print(f"Updating summary comment ID {existing_summarize_cmt_id}...")
+        log.info("Updating summary comment ID %s...", existing_summarize_cmt_id)
         github_api.update_comment(existing_summarize_cmt_id, summary_comment_body)
     elif not all_review_comments and not review_body:
          # If we didn't post a review (no comments and no initial summary body),
          # create the summary comment separately. Handles subsequent runs with no changes/comments.
-         print("Creating new summary comment...")
+         log.info("Creating new summary comment...")
          github_api.post_pr_comment(pr_number, summary_comment_body)
     else:
-         print("Summary included in the review body or updated existing comment; not posting separate summary comment.")
+         log.info("Summary included in the review body or updated existing comment; not posting separate summary comment.")
 
 
-    print("\n--- AI Review Bot Finished ---")
+    log.info("\n--- AI Review Bot Finished ---")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,27 @@
 # src/utils.py - Utility functions (e.g., diff parsing, file filtering)
 
+import os
 import re
-from fnmatch import fnmatch # For gitignore-style pattern matching
+import time
+import atexit
+import json
+import sqlite3
+import hashlib
+from array import array
+from collections import namedtuple
+from itertools import accumulate
+from bisect import bisect_right
+from functools import lru_cache
+from fnmatch import translate # For gitignore-style pattern matching
 
 # --- Constants ---
-HUNK_HEADER_RE = re.compile(r'^@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@')
+# re.ASCII: line numbers are ASCII digits, so skip the Unicode digit tables
+# No '^': the pattern is only used with .match(), which already anchors at the start
+HUNK_HEADER_RE = re.compile(r'@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@', re.ASCII)
+# Same pattern, matching header lines anywhere in a multi-line patch (here the '^' is needed)
+_HUNK_HEADER_LINE_RE = re.compile('^' + HUNK_HEADER_RE.pattern, re.ASCII | re.MULTILINE)
+# Line boundaries str.splitlines() honours besides '\n'; the MULTILINE '^' above only matches after '\n'
+_NON_LF_LINE_BREAK_RE = re.compile('[\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
 
 # --- New Hunk Parsing (Replaces parse_diff) ---
 def parse_hunks_from_patch(patch_text):
@@ -18,59 +35,53 @@ def parse_hunks_from_patch(patch_text):
             {
                 'header': str,         # The full @@ ... @@ line
                 'content': str,        # The content of the hunk (including header)
+                'content_lines': list, # content split into lines (header first)
                 'new_start_line': int, # Start line number in the new file
                 'new_end_line': int,   # End line number in the new file
-                'new_line_count': int  # Number of lines in the new file's part of the hunk
+                'new_line_count': int, # Number of lines in the new file's part of the hunk
+                'line_types': bytes,   # First character of each content line (' ' for empty lines)
+                'cum_new': array       # cum_new[i]: new-file lines among content lines 1..i
             }
         Or None if parsing fails completely.
     """
     if not patch_text:
         return []
 
-    hunks = []
-    current_hunk_content = []
-    current_hunk_info = None
-
-    lines = patch_text.splitlines()
+    if _NON_LF_LINE_BREAK_RE.search(patch_text):
+        # CRLF (or another splitlines() boundary): normalize to '\n' lines first so the slices below
+        # match a line-based parse. The trailing '\n' keeps a final empty line, as splitlines() does.
+        patch_text = '\n'.join(patch_text.splitlines()) + '\n'
 
-    for line in lines:
-        match = HUNK_HEADER_RE.match(line)
-        if match:
-            # Finalize previous hunk if exists
-            if current_hunk_info:
-                current_hunk_info['content'] = '\n'.join(current_hunk_content)
-                hunks.append(current_hunk_info)
-            
-            # Parse new hunk header
-            try:
-                old_start = int(match.group(1))
-                old_len = int(match.group(2) or 1) # Default length is 1 if omitted
-                new_start = int(match.group(3))
-                new_len = int(match.group(4) or 1)
-            except ValueError:
-                print(f"Warning: Could not parse hunk header integers: {line}")
-                current_hunk_info = None # Invalidate current hunk
-                current_hunk_content = []
-                continue
-
-            current_hunk_info = {
-                'header': line,
-                'content': "", # Will be filled later
-                'new_start_line': new_start,
-                'new_end_line': new_start + new_len - 1,
-                'new_line_count': new_len
-            }
-            current_hunk_content = [line] # Start content with header
-            # print(f"Debug: Parsed Hunk Header - Start: {new_start}, Len: {new_len}, End: {new_start + new_len - 1}")
-        
-        elif current_hunk_info:
-            # Add line to current hunk content if we are inside a valid hunk
-            current_hunk_content.append(line)
-
-    # Finalize the last hunk
-    if current_hunk_info:
-        current_hunk_info['content'] = '\n'.join(current_hunk_content)
-        hunks.append(current_hunk_info)
+    hunks = []
+    # Slice each hunk straight out of patch_text (header to next header) instead of
+    # splitting the patch into lines and joining them back together per hunk.
+    headers = list(_HUNK_HEADER_LINE_RE.finditer(patch_text))
+    hunk_ends = [match.start() for match in headers[1:]]
+    hunk_ends.append(len(patch_text))
+    # Bound to locals once; the loop body is small, so per-hunk global/attribute lookups add up on big diffs
+    hunks_append = hunks.append
+    index_hunk_lines = _index_hunk_lines
+    for match, end in zip(headers, hunk_ends):
+        content = patch_text[match.start():end]
+        if content.endswith('\n'):
+            content = content[:-1] # The line break before the next header/end isn't part of the hunk
+        header_end = content.find('\n')
+
+        _, _, new_start, new_len = match.groups() # One call instead of a group() lookup per field
+        new_start = int(new_start)
+        new_len = int(new_len) if new_len else 1 # Default length is 1 if omitted
+        content_lines = content.splitlines() # Kept on the hunk so consumers don't re-split content
+        line_types, cum_new = index_hunk_lines(content_lines)
+        hunks_append({
+            'header': content if header_end == -1 else content[:header_end],
+            'content': content,
+            'content_lines': content_lines,
+            'new_start_line': new_start,
+            'new_end_line': new_start + new_len - 1,
+            'new_line_count': new_len,
+            'line_types': line_types,
+            'cum_new': cum_new
+        })
 
     if not hunks and patch_text: # Check if parsing failed completely despite input
          print(f"Warning: Could not parse any hunks from the provided patch text.")
@@ -79,6 +90,113 @@ def parse_hunks_from_patch(patch_text):
 
     return hunks
 
+_DELETED_LINE = ord('-')
+_NEW_FILE_LINE_TYPES = b' +' # Context and added lines exist in the new file
+
+def _index_hunk_lines(content_lines):
+    """Returns (line_types, cum_new) for a hunk's content lines (header first).
+    line_types holds each line's first character; cum_new[i] counts the context/added lines among
+    lines 1..i, so mapping a hunk line to a file line is a lookup instead of a scan.
+    """
+    # Non-latin-1 first characters become '?'; only ' ', '+' and '-' matter here
+    line_types = ''.join(line[:1] or ' ' for line in content_lines).encode('latin-1', 'replace')
+    cum_new = array('i', accumulate((t in _NEW_FILE_LINE_TYPES for t in line_types[1:]), initial=0))
+    return line_types, cum_new
+
+def _hunk_line_index(hunk_info):
+    """Returns the hunk's (line_types, cum_new), building them for hunk dicts that predate them."""
+    if 'cum_new' not in hunk_info:
+        content_lines = hunk_info.get('content_lines') or hunk_info['content'].splitlines()
+        hunk_info['line_types'], hunk_info['cum_new'] = _index_hunk_lines(content_lines)
+    return hunk_info['line_types'], hunk_info['cum_new']
+
+# --- On-disk cache of parsed hunks ---
+# Re-runs on the same commit range (e.g. the trigger comment posted twice) skip re-parsing.
+HUNK_CACHE_PATH = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "gemini-review", "hunks.sqlite")
+HUNK_CACHE_MAX_ENTRIES = 2000
+# Smaller patches parse faster than a cache lookup + JSON decode, so they bypass the cache
+HUNK_CACHE_MIN_PATCH_CHARS = 50000
+# Bump when the structure returned by parse_hunks_from_patch changes, so stale entries are ignored
+HUNK_CACHE_VERSION = 5
+
+_hunk_cache_conn = None # Opened on first use; False if the cache is unavailable
+# Writes are batched and flushed once at exit: rows parsed this run, and keys of rows hit this run
+_hunk_cache_pending = []
+_hunk_cache_hits = []
+
+def _get_hunk_cache():
+    """Returns the sqlite connection for the hunk cache, or None if it can't be opened."""
+    global _hunk_cache_conn
+    if _hunk_cache_conn is None:
+        try:
+            os.makedirs(os.path.dirname(HUNK_CACHE_PATH), exist_ok=True)
+            conn = sqlite3.connect(HUNK_CACHE_PATH, isolation_level=None) # Autocommit
+            conn.execute("PRAGMA synchronous=OFF") # It's a cache; losing the last writes on a crash is fine
+            conn.execute("CREATE TABLE IF NOT EXISTS hunks(key TEXT PRIMARY KEY, value TEXT, last_used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS hunks_last_used ON hunks(last_used)")
+            _hunk_cache_conn = conn
+            atexit.register(_flush_hunk_cache)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Hunk cache unavailable ({HUNK_CACHE_PATH}): {e}")
+            _hunk_cache_conn = False
+    return _hunk_cache_conn or None
+
+def _flush_hunk_cache():
+    """Writes this run's new rows and hit times in one transaction, then evicts least recently used rows once."""
+    if not (_hunk_cache_conn and (_hunk_cache_pending or _hunk_cache_hits)):
+        return
+    now = time.time()
+    try:
+        with _hunk_cache_conn:
+            _hunk_cache_conn.execute("BEGIN")
+            _hunk_cache_conn.executemany("INSERT OR REPLACE INTO hunks(key, value, last_used) VALUES (?, ?, ?)",
+                                         [(key, value, now) for key, value in _hunk_cache_pending])
+            _hunk_cache_conn.executemany("UPDATE hunks SET last_used = ? WHERE key = ?",
+                                         [(now, key) for key in _hunk_cache_hits])
+            # Walks the last_used index, no sort
+            _hunk_cache_conn.execute("DELETE FROM hunks WHERE key IN (SELECT key FROM hunks ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                                     (HUNK_CACHE_MAX_ENTRIES,))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not write hunk cache: {e}")
+    _hunk_cache_pending.clear()
+    _hunk_cache_hits.clear()
+
+def _hunks_to_json(hunks):
+    """Serializes parsed hunks as JSON (line_types as latin-1 text, cum_new as a list).
+    JSON rather than pickle, so loading a tampered cache file can't run code.
+    """
+    return json.dumps([{**hunk, 'line_types': hunk['line_types'].decode('latin-1'), 'cum_new': hunk['cum_new'].tolist()}
+                       for hunk in hunks])
+
+def _hunks_from_json(value):
+    """Inverse of _hunks_to_json."""
+    return [{**hunk, 'line_types': hunk['line_types'].encode('latin-1'), 'cum_new': array('i', hunk['cum_new'])}
+            for hunk in json.loads(value)]
+
+def parse_hunks_cached(patch_text):
+    """parse_hunks_from_patch with results memoized on disk, keyed on the SHA-1 of the patch text.
+    Only patches of at least HUNK_CACHE_MIN_PATCH_CHARS use the cache. Parse failures (None) are
+    not cached. Cache errors fall back to parsing.
+    """
+    conn = _get_hunk_cache() if patch_text and len(patch_text) >= HUNK_CACHE_MIN_PATCH_CHARS else None
+    if conn is None:
+        return parse_hunks_from_patch(patch_text)
+
+    key = f"{HUNK_CACHE_VERSION}:{hashlib.sha1(patch_text.encode()).hexdigest()}"
+    try:
+        row = conn.execute("SELECT value FROM hunks WHERE key = ?", (key,)).fetchone()
+        if row:
+            hunks = _hunks_from_json(row[0])
+            _hunk_cache_hits.append(key)
+            return hunks
+    except (sqlite3.Error, ValueError, TypeError, KeyError, AttributeError) as e:
+        print(f"Warning: Could not read hunk cache: {e}")
+
+    hunks = parse_hunks_from_patch(patch_text)
+    if hunks is not None:
+        _hunk_cache_pending.append((key, _hunks_to_json(hunks)))
+    return hunks
+
 # --- New Line Mapping Logic ---
 def map_review_to_file_line(hunk_line_relative, hunk_info):
     """Maps a hunk-relative line number (from AI) to an absolute file line number.
@@ -87,7 +205,8 @@ def map_review_to_file_line(hunk_line_relative, hunk_info):
         hunk_line_relative (int): 1-based line number within the hunk content
                                    (excluding the @@ header line) reported by the AI.
         hunk_info (dict): The parsed information for this specific hunk from
-                          parse_hunks_from_patch.
+                          parse_hunks_from_patch. Dicts built elsewhere need only 'content'
+                          (or 'content_lines') and 'new_start_line'.
 
     Returns:
         int | None: The corresponding 1-based line number in the new file, or None
@@ -96,34 +215,23 @@ def map_review_to_file_line(hunk_line_relative, hunk_info):
     if not hunk_info or hunk_line_relative <= 0:
         return None
 
-    hunk_content_lines = hunk_info['content'].splitlines()
+    line_types, cum_new = _hunk_line_index(hunk_info)
     # Index relative to the content lines array (0-based), skipping header
     content_line_index = hunk_line_relative 
 
-    if content_line_index >= len(hunk_content_lines):
-        print(f"Warning: Hunk relative line {hunk_line_relative} is out of bounds for hunk content length {len(hunk_content_lines)}.")
+    if content_line_index >= len(line_types):
+        print(f"Warning: Hunk relative line {hunk_line_relative} is out of bounds for hunk content length {len(line_types)}.")
         return None
 
-    target_line_text = hunk_content_lines[content_line_index]
-    line_type = target_line_text[0] if target_line_text else ' '
-
     # Cannot comment on deleted lines
-    if line_type == '-':
+    if line_types[content_line_index] == _DELETED_LINE:
         print(f"Debug: Hunk relative line {hunk_line_relative} corresponds to a deleted line.")
         return None
 
-    # Count lines starting with ' ' or '+' up to and including the target relative line
-    new_file_line_count = 0
-    for i in range(1, content_line_index + 1): # Iterate through content lines up to target
-        line_text = hunk_content_lines[i]
-        type_char = line_text[0] if line_text else ' '
-        if type_char in [' ', '+']:
-            new_file_line_count += 1
-
-    # Absolute line number is the hunk's start line + the count - 1
-    # (because the count includes the target line itself)
-    absolute_line = hunk_info['new_start_line'] + new_file_line_count - 1
-    # print(f"Debug: map_review: Rel={hunk_line_relative}, Start={hunk_info['new_start_line']}, Count={new_file_line_count}, Abs={absolute_line}")
+    # cum_new counts lines starting with ' ' or '+' up to and including the target relative line,
+    # so the absolute line number is the hunk's start line + the count - 1
+    absolute_line = hunk_info['new_start_line'] + cum_new[content_line_index] - 1
+    # print(f"Debug: map_review: Rel={hunk_line_relative}, Start={hunk_info['new_start_line']}, Count={cum_new[content_line_index]}, Abs={absolute_line}")
     return absolute_line
 
 def find_best_patch_for_line(target_file_line, file_patches):
@@ -143,40 +251,41 @@ def find_best_patch_for_line(target_file_line, file_patches):
     """
     if not file_patches:
         return None, False
+    # Callers mapping many lines of one file should build the bounds once and use find_best_patch_line
+    return find_best_patch_line(target_file_line, build_patch_bounds(file_patches))
 
-    best_patch = None
-    min_distance = float('inf')
-
-    for patch in file_patches:
-        start = patch['new_start_line']
-        end = patch['new_end_line']
-
-        # Check for exact containment first
-        if start <= target_file_line <= end:
-            # print(f"Debug: find_best_patch: Line {target_file_line} is within patch {start}-{end}.")
-            return target_file_line, False # Exact match, no remapping
-
-        # Calculate distance if outside
-        distance = 0
-        if target_file_line < start:
-            distance = start - target_file_line
-        else: # target_file_line > end
-            distance = target_file_line - end
-        
-        if distance < min_distance:
-            min_distance = distance
-            best_patch = patch
-
-    # If we get here, no exact match was found. Use the closest patch.
-    if best_patch:
-        # Attach to the last line of the closest patch range
-        line_to_comment_on = best_patch['new_end_line'] 
-        # print(f"Debug: find_best_patch: Line {target_file_line} is outside patches. Closest patch is {best_patch['new_start_line']}-{best_patch['new_end_line']}. Remapping to {line_to_comment_on}.")
-        return line_to_comment_on, True # Remapped
-    else:
-        # Should not happen if file_patches is not empty, but handle defensively
-        print("Warning: find_best_patch_for_line couldn't find a best patch despite having patches.")
+def build_hunk_line_map(hunk_info):
+    """Precomputes map_review_to_file_line for every line of a hunk: {hunk_line_relative: file_line}.
+    Deleted lines are left out (they can't be commented on), matching map_review_to_file_line returning None.
+    """
+    line_types, cum_new = _hunk_line_index(hunk_info)
+    first_line = hunk_info['new_start_line'] - 1
+    # Same arithmetic as map_review_to_file_line, one pass over the line-type bytes
+    return {relative: first_line + cum_new[relative]
+            for relative in range(1, len(line_types)) if line_types[relative] != _DELETED_LINE}
+
+def build_patch_bounds(file_patches):
+    """Returns (starts, ends): the hunks' new-file line ranges sorted by start, for find_best_patch_line."""
+    bounds = sorted((patch['new_start_line'], patch['new_end_line']) for patch in file_patches)
+    return [start for start, _ in bounds], [end for _, end in bounds]
+
+def find_best_patch_line(target_file_line, patch_bounds):
+    """find_best_patch_for_line over precomputed build_patch_bounds output, using a binary search.
+    Returns (line_to_comment_on, was_remapped), or (None, False) if there are no patches.
+    """
+    starts, ends = patch_bounds
+    if not starts:
         return None, False
+    i = bisect_right(starts, target_file_line) - 1 # Last hunk starting at or before the target
+    if i >= 0 and target_file_line <= ends[i]:
+        return target_file_line, False # Exact match, no remapping
+    # Otherwise the closest hunk is the one just before or just after the target (earlier wins ties)
+    best = None
+    if i >= 0:
+        best = i
+    if i + 1 < len(starts) and (best is None or starts[i + 1] - target_file_line < target_file_line - ends[best]):
+        best = i + 1
+    return ends[best], True # Remapped to the last line of the closest hunk
 
 # --- Legacy Diff Parsing (Commented Out) ---
 # def parse_diff(diff_text):
@@ -190,23 +299,76 @@ def find_best_patch_for_line(target_file_line, file_patches):
 # --- File Filtering ---
 def should_exclude_file(file_path, exclude_patterns):
     """Checks if a file path matches any of the exclude patterns."""
+    is_excluded = compile_exclude(exclude_patterns)
+    return bool(is_excluded and is_excluded(file_path))
+
+# Glob -> regex source, memoized per pattern so pattern lists that share globs translate each only once
+_translate = lru_cache(maxsize=1024)(translate)
+
+_GLOB_SPECIAL_CHARS_RE = re.compile(r'[*?[]')
+
+@lru_cache(maxsize=32)
+def _compile_exclude(patterns_tuple):
+    """Builds the exclude matcher once per distinct pattern list.
+    Most exclude globs are plain names, '*suffix' or 'prefix*' (e.g. '*.md', 'docs/**'); those are
+    checked with set lookups and str.endswith/startswith tuples. Only the remaining globs go through
+    one combined alternation regex.
+    """
+    exact_paths = set()
+    suffixes = []
+    prefixes = []
+    globs = []
+    for pattern in patterns_tuple:
+        literal = pattern.strip('*') # fnmatch's '*' matches anything, '/' included, so runs of them act like one
+        leading_star = pattern.startswith('*')
+        trailing_star = pattern.endswith('*')
+        if _GLOB_SPECIAL_CHARS_RE.search(literal) or (leading_star and trailing_star and literal):
+            globs.append(pattern)
+        elif leading_star:
+            suffixes.append(literal) # '*' alone leaves '', which every path ends with
+        elif trailing_star:
+            prefixes.append(literal)
+        else:
+            exact_paths.add(pattern)
+    suffixes = tuple(suffixes)
+    prefixes = tuple(prefixes)
+    glob_re = re.compile('|'.join(f'(?:{_translate(pattern)})' for pattern in globs)) if globs else None
+
+    def is_excluded(file_path):
+        return (file_path in exact_paths
+                or file_path.endswith(suffixes)
+                or file_path.startswith(prefixes)
+                or (glob_re is not None and glob_re.match(file_path) is not None))
+    return is_excluded
+
+def compile_exclude(exclude_patterns):
+    """Compiles the exclude patterns into one matcher, so each path is checked with a single call.
+    Returns a function file_path -> bool, or None if there are no patterns.
+    """
     if not exclude_patterns:
-        return False
-    for pattern in exclude_patterns:
-        if fnmatch(file_path, pattern):
-            # print(f"Excluding file '{file_path}' due to pattern '{pattern}'") # Debugging
-            return True
-    return False
+        return None
+    return _compile_exclude(tuple(exclude_patterns))
 
 # --- Placeholder for Jira functions (Phase 3) ---
+@lru_cache(maxsize=128)
+def _compile_jira_pattern(keys_tuple):
+    """Compiles (once per distinct set of project keys) the case-insensitive Jira key regex."""
+    # Simple regex: Look for project keys followed by hyphen and digits
+    return re.compile(r'\b(' + '|'.join(keys_tuple) + r')-\d+\b', re.IGNORECASE)
+
 def extract_jira_keys(text, project_keys):
     """Finds potential Jira keys (e.g., ABC-123) in text."""
     if not text or not project_keys:
         return []
-    # Simple regex: Look for project keys followed by hyphen and digits
-    keys_pattern = r'\b(' + '|'.join(project_keys) + r')-\d+\b'
-    found_keys = re.findall(keys_pattern, text, re.IGNORECASE)
-    return list(set(found_keys)) # Return unique keys
+    # Cheap literal checks first: every key needs a '-' and one of the project keys in the text.
+    # The regex ignores case, so compare casefolded (which also folds e.g. 'ſ' to 's' like re does).
+    if '-' not in text:
+        return []
+    folded_text = text.casefold()
+    if not any(key.casefold() in folded_text for key in project_keys):
+        return []
+    keys_pattern = _compile_jira_pattern(tuple(sorted(project_keys)))
+    return list(dict.fromkeys(keys_pattern.findall(text))) # Unique keys, in order of appearance
 
 # --- Legacy Hunk Line to File Line Mapping (Commented Out) ---
 # def map_hunk_line_to_file_line(hunk_header, hunk_content, hunk_line_number):
@@ -225,61 +387,100 @@ def extract_jira_keys(text, project_keys):
 # --- Context Extraction Logic (Remains largely the same) ---
 
 def _get_indentation(line):
-    """Returns the number of leading spaces."""
+    """Returns the number of leading spaces.
+    (lstrip runs the scan in C, which beats a per-character Python loop despite the temporary copy.)
+    """
     return len(line) - len(line.lstrip(' '))
 
-def _find_block_boundaries(lines, start_index):
-    """Attempts to find function/class boundaries around a start index based on indentation (Python focus)."""
+# Indentation scans run over a bytes copy of the file's indents (see _parse_file_for_context):
+# bytes.translate marks the wanted lines and find/rfind locate them in C, a window at a time
+# (the window grows, so short scans stay cheap and long ones stay linear).
+_INDENT_SCAN_WINDOW = 64
+
+@lru_cache(maxsize=256)
+def _indented_at_most_table(max_indent):
+    """bytes.translate table mapping indentations <= max_indent to 1 and the rest to 0."""
+    return bytes(indent <= max_indent for indent in range(256))
+
+def _next_line_indented_at_most(indents, max_indent, start):
+    """Returns the first index >= start whose indentation is <= max_indent, or -1."""
+    if isinstance(indents, bytes):
+        table = _indented_at_most_table(min(max_indent, 255))
+        window = _INDENT_SCAN_WINDOW
+        while start < len(indents):
+            found = indents[start:start + window].translate(table).find(1)
+            if found >= 0:
+                return start + found
+            start += window
+            window *= 4
+        return -1
+    for i in range(start, len(indents)):
+        if indents[i] <= max_indent:
+            return i
+    return -1
+
+def _prev_line_indented_at_most(indents, max_indent, end):
+    """Returns the last index < end whose indentation is <= max_indent, or -1."""
+    if isinstance(indents, bytes):
+        table = _indented_at_most_table(min(max_indent, 255))
+        window = _INDENT_SCAN_WINDOW
+        while end > 0:
+            start = max(0, end - window)
+            found = indents[start:end].translate(table).rfind(1)
+            if found >= 0:
+                return start + found
+            end = start
+            window *= 4
+        return -1
+    for i in range(end - 1, -1, -1):
+        if indents[i] <= max_indent:
+            return i
+    return -1
+
+def _is_definition(line):
+    """Returns True for 'def ...' / 'class ...' lines."""
+    return line.strip().startswith(("def ", "class "))
+
+def _find_block_boundaries(lines, start_index, indents=None):
+    """Attempts to find function/class boundaries around a start index based on indentation (Python focus).
+    indents, if given, holds the indentation of every line (see _parse_file_for_context).
+    """
     if start_index >= len(lines) or start_index < 0:
         return None, None
+    if indents is None:
+        indents = [_get_indentation(line) for line in lines]
 
-    start_line_indent = _get_indentation(lines[start_index])
+    start_line_indent = indents[start_index]
 
     # Find the start of the block (e.g., 'def' or 'class' line)
-    block_start_index = start_index
-    for i in range(start_index, -1, -1):
-        line = lines[i]
-        indent = _get_indentation(line)
-        # If we find a line with less indentation, the line *after* it is likely the start
-        # Or if we hit the top-level 'def' or 'class'
-        if indent < start_line_indent or (indent == 0 and (line.strip().startswith("def ") or line.strip().startswith("class "))):
-            block_start_index = i
-            # If the found line is 'def' or 'class', keep it. Otherwise, the block starts *after* this less indented line.
-            if not (line.strip().startswith("def ") or line.strip().startswith("class ")):
-                 block_start_index = i + 1
-            break
-        # If we are already at indent 0 and haven't found def/class, assume the start is the first line
-        if indent == 0 and i < start_index:
+    if start_line_indent == 0 and _is_definition(lines[start_index]):
+        block_start_index = start_index # A top-level 'def' or 'class' starts its own block
+    else:
+        # The closest earlier line with less indentation (any earlier top-level line for top-level code)
+        i = _prev_line_indented_at_most(indents, max(start_line_indent, 1) - 1, start_index)
+        if i < 0: # Reached file start
+            block_start_index = 0
+        elif start_line_indent == 0 or _is_definition(lines[i]):
             block_start_index = i
-            break
-    else: # Loop completed without break (reached file start)
-        block_start_index = 0
-
+        else: # The block starts *after* this less indented line
+            block_start_index = i + 1
 
     # Find the end of the block
-    block_end_index = start_index
-    block_start_line_indent = _get_indentation(lines[block_start_index]) # Indent of the 'def' or 'class' line itself
-
-    for i in range(start_index + 1, len(lines)):
-        line = lines[i]
+    block_end_index = len(lines) - 1 # Unless another line ends it first (reached file end)
+    block_start_line_indent = indents[block_start_index] # Indent of the 'def' or 'class' line itself
+
+    # Block ends at the first line (not empty, not a comment) with indentation <= the block's
+    # starting line's indentation. Deeper lines are part of the block whatever they contain,
+    # so only lines at or above that indentation need stripping.
+    # (For a top-level block that means indent 0; lines before start_index are never checked.)
+    i = _next_line_indented_at_most(indents, block_start_line_indent, start_index + 1)
+    while i >= 0:
+        stripped_line = lines[i].strip()
         # Skip empty or comment lines for boundary detection
-        if not line.strip() or line.strip().startswith('#'):
-            block_end_index = i
-            continue
-
-        indent = _get_indentation(line)
-        # Block ends when we find a line with indentation <= the block's starting line's indentation
-        # Need to be careful if the block starts at indent 0
-        if block_start_line_indent == 0:
-             if indent == 0 and i > block_start_index: # Found another top-level definition or end of file
-                 block_end_index = i -1 # The previous line was the end
-                 break
-        elif indent <= block_start_line_indent:
-             block_end_index = i - 1 # The previous line was the end
-             break
-        block_end_index = i # Otherwise, this line is still part of the block
-    else: # Loop completed without break (reached file end)
-        block_end_index = len(lines) - 1
+        if stripped_line and not stripped_line.startswith('#'):
+            block_end_index = i - 1 # The previous line was the end
+            break
+        i = _next_line_indented_at_most(indents, block_start_line_indent, i + 1)
 
     # Ensure start <= end
     if block_start_index > block_end_index:
@@ -291,6 +492,51 @@ def _find_block_boundaries(lines, start_index):
     return block_start_index, block_end_index
 
 
+# Import lines ("import x" / "from x import y", possibly indented), and a run of import/blank lines.
+# [^\S\n] is whitespace other than the line break, so matches never spill onto the next line.
+_IMPORT_LINE_RE = re.compile(r'^[^\S\n]*(?:import |from )[^\n]*', re.MULTILINE)
+_IMPORT_RUN_RE = re.compile(r'(?:[^\S\n]*(?:(?:import |from )[^\n]*)?(?:\n|\Z))*')
+
+IMPORT_SCAN_LINES = 100 # Head of the file searched with the regexes; import blocks almost always start and end there
+
+def _extract_imports(lines, full_file_content):
+    """Returns the file's import block: the import lines from the first one up to the first
+    non-import, non-empty line, joined with newlines.
+    """
+    if "import " not in full_file_content and "from " not in full_file_content:
+        return "" # No line can match; skip scanning the file
+    text = "\n".join(lines[:IMPORT_SCAN_LINES])
+    first_import = _IMPORT_LINE_RE.search(text)
+    if first_import:
+        import_run = _IMPORT_RUN_RE.match(text, first_import.start()).group()
+        # Conclusive unless the block runs up to the end of the head and the file goes on
+        if first_import.start() + len(import_run) < len(text) or len(lines) <= IMPORT_SCAN_LINES:
+            return "\n".join(_IMPORT_LINE_RE.findall(import_run))
+    elif len(lines) <= IMPORT_SCAN_LINES:
+        return ""
+
+    # Block starts or continues past the head: scan line by line
+    imports_section = []
+    for line in lines:
+        stripped_line = line.strip()
+        if stripped_line.startswith("import ") or stripped_line.startswith("from "):
+            imports_section.append(line)
+        elif imports_section and stripped_line: # Stop after first non-import, non-empty line
+            break
+    return "\n".join(imports_section)
+
+# Per-file data extract_context_around_hunk needs, shared by all hunks of a file
+_FileContext = namedtuple('_FileContext', ['lines', 'indents', 'imports'])
+
+@lru_cache(maxsize=64)
+def _parse_file_for_context(full_file_content):
+    """Splits the file and computes each line's indentation and the import block, once per file content."""
+    lines = tuple(full_file_content.splitlines())
+    indents = list(map(_get_indentation, lines))
+    # One byte per line lets _find_block_boundaries scan the indents in C
+    indents = bytes(indents) if max(indents, default=0) <= 255 else array('i', indents)
+    return _FileContext(lines, indents, _extract_imports(lines, full_file_content))
+
 def extract_context_around_hunk(full_file_content, hunk_header, fallback_lines=20):
     """Extracts relevant context (imports + function/class or fallback lines) for a hunk."""
 
@@ -301,17 +547,14 @@ def extract_context_around_hunk(full_file_content, hunk_header, fallback_lines=2
         # print("Debug: Full file content is empty, likely a new or deleted file. No context extracted.")
         return "" # No context to extract
 
-    lines = full_file_content.splitlines()
+    # 1. Split the file and extract imports (Python specific for now); cached across the file's hunks
+    file_context = _parse_file_for_context(full_file_content)
+    lines = file_context.lines
 
-    # 1. Extract Imports (Python specific for now)
-    imports_section = []
-    for line in lines:
-        stripped_line = line.strip()
-        if stripped_line.startswith("import ") or stripped_line.startswith("from "):
-            imports_section.append(line)
-        elif imports_section and stripped_line: # Stop after first non-import, non-empty line
-            break
-    imports_context = "\n".join(imports_section)
+    # Tiny files fit in the fallback window anyway: send them whole and skip the block finder
+    if len(lines) <= 2 * fallback_lines:
+        return full_file_content.strip()
+    imports_context = file_context.imports
 
     # 2. Find Hunk's position in the original file
     #    We need the *starting line number* in the *new* file from the hunk header
@@ -320,8 +563,8 @@ def extract_context_around_hunk(full_file_content, hunk_header, fallback_lines=2
     if not match:
         print(f"Warning: Could not parse hunk header '{hunk_header}' for context extraction.")
         # Fallback: Provide imports and maybe first/last N lines?
-        context_lines = lines[:fallback_lines] + ["..."] + lines[-fallback_lines:]
-        return imports_context + "\n\n... (Context fallback due to header parse error) ...\n\n" + "\n".join(context_lines)
+        return "\n".join([imports_context, "", "... (Context fallback due to header parse error) ...", "",
+                          *lines[:fallback_lines], "...", *lines[-fallback_lines:]])
 
     try:
         # Use the OLD start line number (group 1) as it relates to the base file content
@@ -329,8 +572,8 @@ def extract_context_around_hunk(full_file_content, hunk_header, fallback_lines=2
     except ValueError:
         print(f"Warning: Could not parse hunk old start line number from header: {hunk_header}")
         # Fallback as above
-        context_lines = lines[:fallback_lines] + ["..."] + lines[-fallback_lines:]
-        return imports_context + "\n\n... (Context fallback due to header number parse error) ...\n\n" + "\n".join(context_lines)
+        return "\n".join([imports_context, "", "... (Context fallback due to header number parse error) ...", "",
+                          *lines[:fallback_lines], "...", *lines[-fallback_lines:]])
 
     # Find the corresponding line index (0-based) in the *original* full file content
     # Use the old start line number directly, adjusted for 0-based index.
@@ -339,37 +582,37 @@ def extract_context_around_hunk(full_file_content, hunk_header, fallback_lines=2
 
     # 3. Find Function/Class Boundaries
     #    Use indentation-based logic (can be improved for other languages)
-    block_start_index, block_end_index = _find_block_boundaries(lines, approx_line_index)
+    block_start_index, block_end_index = _find_block_boundaries(lines, approx_line_index, file_context.indents)
 
-    # 4. Construct Context String
-    block_context = ""
+    # 4. Construct Context (collected as lines and joined once at the end)
+    block_lines = ()
     if block_start_index is not None and block_end_index is not None:
         # Ensure indices are within bounds
         block_start_index = max(0, block_start_index)
         block_end_index = min(len(lines) - 1, block_end_index)
         # Extract lines, handling potential empty ranges
-        if block_start_index <= block_end_index:
-             block_lines = lines[block_start_index : block_end_index + 1]
-             block_context = "\n".join(block_lines)
-             # Optional: Add ellipsis if block is very large?
-    
-    # Fallback if block finding failed or produced empty result
-    if not block_context:
+        block_lines = lines[block_start_index : block_end_index + 1]
+        # Optional: Add ellipsis if block is very large?
+
+    # Fallback if block finding failed or produced empty result (no lines, or a single empty one)
+    if len(block_lines) <= 1 and not any(block_lines):
          print(f"Debug: Block context finding failed or was empty for hunk starting near line {approx_line_index + 1}. Using fallback window.")
          start_fallback = max(0, approx_line_index - fallback_lines // 2)
          end_fallback = min(len(lines), approx_line_index + fallback_lines // 2 + 1)
-         fallback_context_lines = lines[start_fallback:end_fallback]
-         block_context = "\n".join(fallback_context_lines)
+         block_lines = list(lines[start_fallback:end_fallback])
          if start_fallback > 0:
-             block_context = "...\n" + block_context
+             block_lines.insert(0, "...")
          if end_fallback < len(lines):
-             block_context = block_context + "\n..."
+             block_lines.append("...")
 
     # Combine imports and block context
-    final_context = imports_context
-    if imports_context and block_context:
-        final_context += "\n\n---\n\n" # Separator
-    final_context += block_context
+    context_parts = []
+    if imports_context:
+        context_parts.append(imports_context)
+        if len(block_lines) > 1 or any(block_lines):
+            context_parts += ["", "---", ""] # Separator
+    context_parts += block_lines
+    final_context = "\n".join(context_parts)
 
     # Limit total context size? (Could do this here or in the calling function)
     # MAX_CONTEXT_CHARS = 3000